@@ -1,39 +1,37 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
 import os
 import sqlite3
-import io
-import pdfplumber
-import re
+import tempfile
 import shutil   # Para apagar pastas
 import time     # Para delay na mensagem
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, date
-from openai import OpenAI
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from banco import (init_db, conexao, transacao, semear_padroes, invalidar_tabelas,
+                   run_query, load_data, get_config, set_config, update_full_table, agregar_resumo,
+                   buscar_ids, chave_dados, versao_tabela,
+                   criar_snapshot, listar_snapshots, DIR_SNAPSHOTS, impressoes, impressoes_existentes,
+                   SQL_UPSERT_CLIENTE, params_cliente, id_cliente, colunas_tabela,
+                   filtro_sql, pagina_keyset, totais_filtro)
+from importacao import processar_lote, criar_pool_importacao, sha256_arquivo, CacheImportacao
+from classificacao import classificar_lote_com_ia, ModeloLocal
+from diagnostico import (iniciar_rerun, finalizar_rerun, anotar, secao, span, cronometrado, marcar_miss,
+                         ler_registros, resumo_spans)
+from documentos import (DIR_DOCUMENTOS, gravar_uploads, salvar_documentos, clientes_com_documentos, documentos_do_cliente,
+                        ler_documento, ler_arquivo, listar_pasta, zip_arquivos, caminho_blob)
 
 # ==========================================
 # 1. CONFIGURAÇÃO INICIAL
 # ==========================================
 st.set_page_config(page_title="CMG System Pro", layout="wide", page_icon="💎")
 
+# Diagnóstico de desempenho (ver diagnostico.py): tempos deste rerun, seção a seção
+ctx_rerun = get_script_run_ctx()
+iniciar_rerun(ctx_rerun.session_id if ctx_rerun else "local")
+secao("1. login")
 
-import os
-
-# ... seus imports ...
-
-DB_NAME = 'cmg_system.db'
-
-# Verifica se o arquivo existe e se é válido (tenta conectar)
-if os.path.exists(DB_NAME):
-    try:
-        with sqlite3.connect(DB_NAME) as conn:
-            c = conn.cursor()
-            c.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    except sqlite3.DatabaseError:
-        # Se der erro, apaga o arquivo corrompido para criar um novo
-        print("Banco de dados corrompido detectado. Recriando...")
-        os.remove(DB_NAME)
 # ==========================================
 # 1.1 SISTEMA DE LOGIN E USUÁRIOS
 # ==========================================
@@ -64,7 +62,7 @@ def check_login():
                 if st.button("Entrar", type="primary", use_container_width=True):
                     if user in USERS and USERS[user]["pass"] == password:
                         st.session_state.logged_in = True
-                        st.session_state.user_info = USERS[user]
+                        st.session_state.user_info = {**USERS[user], "login": user}
                         st.session_state.theme = USERS[user]["theme"]
                         st.rerun()
                     else:
@@ -74,6 +72,8 @@ def check_login():
 
 if not check_login():
     st.stop()
+usuario_admin = st.session_state.user_info.get("login") == "admin"
+anotar(usuario=st.session_state.user_info.get("login"))
 
 # ==========================================
 # 2. FUNÇÕES AUXILIARES E FORMATAÇÃO BR
@@ -85,153 +85,67 @@ def format_brl(value):
     return f"R$ {value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
 # ==========================================
-# 3. BANCO DE DADOS
+# 3. BANCO DE DADOS (ver banco.py)
 # ==========================================
-DB_NAME = 'cmg_system.db'
-BASE_DIR_ARQUIVOS = 'documentos_clientes'
-
-if not os.path.exists(BASE_DIR_ARQUIVOS): os.makedirs(BASE_DIR_ARQUIVOS)
-
-def init_db():
-    with sqlite3.connect(DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute('CREATE TABLE IF NOT EXISTS clientes (id INTEGER PRIMARY KEY AUTOINCREMENT, Nome TEXT, CPF TEXT, Email TEXT, Telefone TEXT, Data_Cadastro TEXT, Obs TEXT)')
-        c.execute('CREATE TABLE IF NOT EXISTS consultores (id INTEGER PRIMARY KEY AUTOINCREMENT, Nome TEXT)')
-        c.execute('CREATE TABLE IF NOT EXISTS bancos (id INTEGER PRIMARY KEY AUTOINCREMENT, Banco TEXT, Agencia TEXT, Conta TEXT)')
-        
-        c.execute('CREATE TABLE IF NOT EXISTS servicos (id INTEGER PRIMARY KEY AUTOINCREMENT, Nome TEXT)')
-        c.execute("SELECT count(*) FROM servicos")
-        if c.fetchone()[0] == 0:
-            padroes = [("Limpeza Nome",), ("Score",), ("Consultoria",), ("Jurídico",)]
-            c.executemany("INSERT INTO servicos (Nome) VALUES (?)", padroes)
-        
-        # --- NOVA TABELA: CATEGORIAS DE DESPESAS ---
-        c.execute('CREATE TABLE IF NOT EXISTS categorias_despesas (id INTEGER PRIMARY KEY AUTOINCREMENT, Nome TEXT)')
-        c.execute("SELECT count(*) FROM categorias_despesas")
-        if c.fetchone()[0] == 0:
-            # Categorias Padrão Iniciais
-            cats_padrao = [("Fixo",), ("Comissões",), ("Marketing",), ("Impostos",), ("Pessoal",), ("Transporte",)]
-            c.executemany("INSERT INTO categorias_despesas (Nome) VALUES (?)", cats_padrao)
-        # -------------------------------------------
-
-        c.execute('CREATE TABLE IF NOT EXISTS config (chave TEXT PRIMARY KEY, valor TEXT)')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS vendas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, Data TEXT, Consultor TEXT, Cliente TEXT, CPF TEXT, 
-            Servico TEXT, Valor REAL, Status_Pagamento TEXT, Conta_Recebimento TEXT, Obs TEXT, Docs TEXT, 
-            Email TEXT, Telefone TEXT, Empresa_Pagadora TEXT
-        )''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS despesas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, Data TEXT, Categoria TEXT, Descricao TEXT, 
-            Conta_Origem TEXT, Valor REAL, Fornecedor TEXT
-        )''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS mural (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, Data TEXT, Titulo TEXT, Mensagem TEXT, Tipo TEXT, Autor TEXT
-        )''')
-        
-        # --- MIGRATIONS ---
-        colunas_vendas = ["Email", "Telefone", "Obs", "Conta_Recebimento", "Empresa_Pagadora"]
-        for col in colunas_vendas:
-            try: c.execute(f"ALTER TABLE vendas ADD COLUMN {col} TEXT"); 
-            except: pass
-            
-        colunas_despesas = ["Conta_Origem", "Fornecedor"]
-        for col in colunas_despesas:
-            try: c.execute(f"ALTER TABLE despesas ADD COLUMN {col} TEXT"); 
-            except: pass
-        
-        try: c.execute("INSERT OR IGNORE INTO config (chave, valor) VALUES ('meta_mensal', '50000')")
-        except: pass
-        try: c.execute("INSERT OR IGNORE INTO config (chave, valor) VALUES ('meta_anual', '600000')")
-        except: pass
-        
-        conn.commit()
-
+secao("3. banco de dados")
 init_db()
 
-def run_query(query, params=()):
-    with sqlite3.connect(DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute(query, params)
-        conn.commit()
-    st.cache_data.clear()
+# Uploads novos vão para o armazenamento de documentos (documentos.py); as pastas
+# por cliente das versões anteriores continuam aqui e aparecem em ARQUIVOS
+BASE_DIR_ARQUIVOS = DIR_DOCUMENTOS
 
-@st.cache_data(ttl=3600, show_spinner=False)
-def load_data(table_name):
-    with sqlite3.connect(DB_NAME) as conn:
-        try:
-            df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-        except:
-            df = pd.DataFrame() 
-    return df
-
-def get_config(chave):
-    with sqlite3.connect(DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute("SELECT valor FROM config WHERE chave=?", (chave,))
-        res = c.fetchone()
-        try: return float(res[0]) if res else 0.0
-        except: return 0.0
-
-def set_config(chave, valor):
-    with sqlite3.connect(DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute("INSERT OR REPLACE INTO config (chave, valor) VALUES (?, ?)", (chave, str(valor)))
-        conn.commit()
-    st.cache_data.clear()
-
-def update_full_table(df_edited_view, table_name):
-    with sqlite3.connect(DB_NAME) as conn:
-        df_full = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-        
-        if "Excluir" in df_edited_view.columns:
-            ids_to_delete = df_edited_view[df_edited_view["Excluir"] == True]["id"].tolist()
-            df_to_update = df_edited_view[df_edited_view["Excluir"] == False].drop(columns=["Excluir"])
-        else:
-            ids_to_delete = []
-            df_to_update = df_edited_view
-
-        if ids_to_delete:
-            df_full = df_full[~df_full['id'].isin(ids_to_delete)]
-
-        if not df_to_update.empty:
-            df_full["id"] = df_full["id"].astype(int)
-            df_to_update["id"] = df_to_update["id"].astype(int)
-            if 'Data' in df_to_update.columns:
-                df_to_update['Data'] = df_to_update['Data'].astype(str)
-
-            df_full.set_index("id", inplace=True)
-            df_to_update.set_index("id", inplace=True)
-            df_full.update(df_to_update)
-            df_full.reset_index(inplace=True)
+if not os.path.exists(BASE_DIR_ARQUIVOS): os.makedirs(BASE_DIR_ARQUIVOS)
 
-        if 'Data' in df_full.columns:
-            df_full['Data'] = df_full['Data'].astype(str)
-            
-        df_full.to_sql(table_name, conn, if_exists='replace', index=False)
-    st.cache_data.clear()
-
-def salvar_arquivos(arquivos, nome_cliente):
-    if not arquivos: return 0
-    safe_folder = "".join([c for c in nome_cliente if c.isalnum() or c in (' ', '_')]).strip().replace(" ", "_")
-    path = os.path.join(BASE_DIR_ARQUIVOS, safe_folder)
-    if not os.path.exists(path): os.makedirs(path)
-    for arq in arquivos:
-        with open(os.path.join(path, arq.name), "wb") as f:
-            f.write(arq.getbuffer())
-    return len(arquivos)
-
-def converter_para_excel(dfs_dict):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        for name, df in dfs_dict.items():
-            df_export = df.copy()
-            if "Data" in df_export.columns:
-                df_export["Data"] = df_export["Data"].astype(str)
-            df_export.to_excel(writer, index=False, sheet_name=name)
-    return output.getvalue()
+# Abas do backup Excel -> tabela
+ABAS_BACKUP = {"Vendas": "vendas", "Despesas": "despesas", "Clientes": "clientes", "Servicos": "servicos", "Mural": "mural"}
+DIR_EXPORTACAO = os.path.join(".cache", "exportacao")
+MAX_BACKUPS_EXCEL = 3
+
+@cronometrado(linhas=lambda total: total)
+def converter_para_excel(conn, abas, destino, tamanho_bloco=5000):
+    """Grava as tabelas no xlsx em modo write-only, bloco a bloco (sem montar DataFrames). Retorna o total de linhas"""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    total = 0
+    for nome, tabela in abas.items():
+        ws = wb.create_sheet(nome)
+        cur = conn.execute(f"SELECT {', '.join(colunas_tabela(conn, tabela))} FROM {tabela}")
+        ws.append([col[0] for col in cur.description])
+        while True:
+            linhas = cur.fetchmany(tamanho_bloco)
+            if not linhas: break
+            for linha in linhas: ws.append(linha)
+            total += len(linhas)
+    wb.save(destino)
+    return total
+
+def backup_excel():
+    """Bytes do backup Excel; só é gerado de novo quando alguma tabela mudou"""
+    with conexao() as conn:
+        if not conn.in_transaction: conn.execute("BEGIN")  # versões e dados do mesmo instante
+        versoes = [versao_tabela(t) for t in ABAS_BACKUP.values()]
+        nome = f"backup_{'_'.join(map(str, versoes))}.xlsx"
+        caminho = os.path.join(DIR_EXPORTACAO, nome)
+        try:
+            return ler_arquivo(caminho)
+        except FileNotFoundError:
+            pass   # ainda não gerado (ou removido pela limpeza): gera agora
+        os.makedirs(DIR_EXPORTACAO, exist_ok=True)
+        fd, temp = tempfile.mkstemp(suffix=".xlsx", dir=DIR_EXPORTACAO)
+        os.close(fd)
+        try:
+            converter_para_excel(conn, ABAS_BACKUP, temp)
+            os.replace(temp, caminho)
+        finally:
+            if os.path.exists(temp): os.remove(temp)
+        dados = ler_arquivo(caminho)
+    # Ficam os MAX_BACKUPS_EXCEL mais novos: outra sessão pode estar lendo um dos anteriores
+    antigos = sorted((e.stat().st_mtime, e.path) for e in os.scandir(DIR_EXPORTACAO)
+                     if e.name.startswith("backup_") and e.name != nome)
+    for _, antigo in antigos[:max(len(antigos) - (MAX_BACKUPS_EXCEL - 1), 0)]:
+        try: os.remove(antigo)
+        except FileNotFoundError: pass   # já removido por outra sessão
+    return dados
 
 # ==========================================
 # 4. SISTEMA DE TEMAS & CSS
@@ -275,209 +189,246 @@ CSS_DARK = CSS_BASE + """
 # ==========================================
 # 5. FUNÇÕES DE FILTRO AVANÇADO
 # ==========================================
-def renderizar_filtros_avancados(df, multiselect_cols, search_cols=None, key_prefix="filter"):
-    df_filtrado = df.copy()
+def mascara_texto(df, search_cols, termo, tabela=None):
+    # Com `tabela`, a busca usa o índice FTS5 do banco (ver banco.BUSCAS)
+    if tabela and "id" in df.columns:
+        return df["id"].isin(buscar_ids(tabela, termo) or []).to_numpy()
+    mask = np.zeros(len(df), dtype=bool)
+    for col in search_cols:
+        if col in df.columns:
+            mask |= df[col].astype(str).str.lower().str.contains(termo.lower(), na=False).to_numpy()
+    return mask
+
+def filtrar_por_texto(df, search_cols, termo, tabela=None):
+    return df[mascara_texto(df, search_cols, termo, tabela)]
+
+def codificar_colunas(df, cols):
+    """Códigos categóricos por coluna: {col: (codigos, opcoes)}.
+    opcoes = valores distintos como texto, ordenados; código -1 = vazio (NULL ou "")"""
+    res = {}
+    for col in cols:
+        if col not in df.columns: continue
+        codigos, distintos = pd.factorize(df[col])
+        opcoes, inverso = np.unique(np.array([str(x) for x in distintos], dtype=object), return_inverse=True)
+        inverso = np.asarray(inverso, dtype=np.int64).ravel()
+        if len(opcoes) and opcoes[0] == "":
+            # "" (o COALESCE dos resumos diários) é vazio, não uma opção do multiselect
+            opcoes, inverso = opcoes[1:], inverso - 1
+        codigos = np.where(codigos >= 0, inverso[np.maximum(codigos, 0)], -1) if len(inverso) else codigos
+        res[col] = (codigos, opcoes.tolist())
+    return res
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def _codificar_colunas_cached(_df, cols, versao):
+    # `versao` (tabela, versão, período) identifica o conteúdo de _df, que não é "hasheado"
+    return codificar_colunas(_df, list(cols))
+
+@cronometrado("filtros avançados", linhas=len)
+def renderizar_filtros_avancados(df, multiselect_cols, search_cols=None, key_prefix="filter", busca_detalhe=None, tabela=None, versao=None):
+    # busca_detalhe(termo): quando df é um resumo (sem as colunas de busca), retorna o resumo das linhas encontradas
+    # versao: chave_dados(...) de onde df veio; permite reaproveitar os códigos/opções entre reruns
     with st.expander("🔎 Filtros Avançados (Clique para abrir)", expanded=False):
+        mascara_busca = None
         if search_cols:
             termo = st.text_input(f"Buscar por: {', '.join(search_cols)}", key=f"{key_prefix}_search")
             if termo:
-                mask = pd.Series(False, index=df_filtrado.index)
-                for col in search_cols:
-                    if col in df_filtrado.columns:
-                        mask |= df_filtrado[col].astype(str).str.lower().str.contains(termo.lower(), na=False)
-                df_filtrado = df_filtrado[mask]
+                if busca_detalhe:
+                    df, versao = busca_detalhe(termo), None
+                else:
+                    mascara_busca = mascara_texto(df, search_cols, termo, tabela)
         st.divider()
+
+        cols_validas = [c for c in (multiselect_cols or []) if c in df.columns]
+        if versao is not None:
+            codigos = _codificar_colunas_cached(df, tuple(cols_validas), versao)
+        else:
+            codigos = codificar_colunas(df, cols_validas)
+
+        # Máscara de cada coluna a partir das seleções atuais (session_state)
+        mascaras = {}
+        for col in cols_validas:
+            cod, opcoes = codigos[col]
+            selecionados = st.session_state.get(f"{key_prefix}_{col}") or []
+            if selecionados:
+                idx = [i for i, o in enumerate(opcoes) if o in set(selecionados)]
+                mascaras[col] = np.isin(cod, idx)
+
+        base = mascara_busca if mascara_busca is not None else np.ones(len(df), dtype=bool)
         if multiselect_cols:
             cols = st.columns(len(multiselect_cols))
             for i, col in enumerate(multiselect_cols):
-                if col in df.columns:
-                    unique_values = df[col].dropna().unique()
-                    unique_values = sorted([str(x) for x in unique_values])
-                    selected = cols[i].multiselect(f"{col}", unique_values, key=f"{key_prefix}_{col}")
-                    if selected:
-                        df_filtrado = df_filtrado[df_filtrado[col].astype(str).isin(selected)]
-    return df_filtrado
+                if col not in codigos: continue
+                cod, opcoes = codigos[col]
+                # Opções restritas ao que sobra com os demais filtros (mantendo o que já está selecionado)
+                outras = base.copy()
+                for c, m in mascaras.items():
+                    if c != col: outras &= m
+                presentes = np.bincount(cod[outras & (cod >= 0)], minlength=len(opcoes)) > 0
+                selecionados = st.session_state.get(f"{key_prefix}_{col}") or []
+                disponiveis = [o for o, p in zip(opcoes, presentes) if p or o in selecionados]
+                cols[i].multiselect(f"{col}", disponiveis, key=f"{key_prefix}_{col}")
+
+    mascara = base
+    for m in mascaras.values():
+        mascara = mascara & m
+    return df[mascara]
 
 # ==========================================
 # 6. FUNÇÕES DE IMPORTAÇÃO
 # ==========================================
-def clean_currency(val_str):
-    if pd.isna(val_str): return 0.0
-    if isinstance(val_str, (int, float)): return float(val_str)
-    clean = str(val_str).strip()
-    is_negative = "-" in clean or "D" in clean.upper() or "(" in clean
-    clean = re.sub(r'[^\d.,]', '', clean)
-    if not clean: return 0.0
-    if "," in clean and "." in clean:
-        clean = clean.replace(".", "").replace(",", ".")
-    elif "," in clean:
-        clean = clean.replace(",", ".")
-    try:
-        val = float(clean)
-        return -val if is_negative else val
-    except:
-        return 0.0
-
-def parse_pdf_data(date_str):
-    if not date_str: return str(date.today())
-    match = re.search(r'\d{2}/\d{2}/\d{2,4}', str(date_str))
-    if match:
-        d = match.group(0)
-        try: return str(datetime.strptime(d, "%d/%m/%Y").date())
-        except:
-            try: return str(datetime.strptime(d, "%d/%m/%y").date())
-            except: pass
-    return str(date.today())
-
-def processar_arquivo_inteligente(file):
-    df = pd.DataFrame()
-    filename = file.name.lower()
-    if filename.endswith(('.xlsx', '.xls')):
-        try: df = pd.read_excel(file)
-        except: return None, "Erro ao ler Excel."
-    elif filename.endswith('.pdf'):
-        all_rows = []
-        try:
-            with pdfplumber.open(file) as pdf:
-                for page in pdf.pages:
-                    table = page.extract_table()
-                    if not table:
-                        table = page.extract_table(table_settings={"vertical_strategy": "text", "horizontal_strategy": "text", "snap_tolerance": 3})
-                    if table: all_rows.extend(table)
-            if not all_rows: return None, "PDF vazio ou ilegível."
-            df = pd.DataFrame(all_rows[1:], columns=all_rows[0])
-        except Exception as e: return None, f"Erro PDF: {e}"
-    else:
-        return None, "Formato não suportado."
-
-    df = df.dropna(axis=1, how='all')
-    df.columns = [str(c).replace("\n", " ").strip() for c in df.columns]
-    cols_lower = [c.lower() for c in df.columns]
-
-    def get_col_by_keyword(keywords):
-        for i, c in enumerate(cols_lower):
-            if any(k in c for k in keywords): return df.iloc[:, i]
-        return None
-
-    s_data = get_col_by_keyword(['data', 'dt', 'date', 'movimento'])
-    s_valor = get_col_by_keyword(['valor', 'value', 'amount', 'débito', 'crédito', 'saldo'])
-    if s_data is None and len(df.columns) > 0: s_data = df.iloc[:, 0]
-    if s_valor is None and len(df.columns) > 1: s_valor = df.iloc[:, -1]
-
-    s_desc = get_col_by_keyword(['descri', 'histórico', 'memo', 'lançamento', 'discriminacao'])
-    if s_desc is None:
-        max_len = 0
-        best_col_idx = -1
-        for i, col_name in enumerate(df.columns):
-            is_data = (s_data is not None and df.iloc[:, i].equals(s_data))
-            is_valor = (s_valor is not None and df.iloc[:, i].equals(s_valor))
-            if not is_data and not is_valor:
-                try:
-                    mean_len = df.iloc[:, i].astype(str).map(len).mean()
-                    if mean_len > max_len: max_len, best_col_idx = mean_len, i
-                except: pass
-        if best_col_idx != -1: s_desc = df.iloc[:, best_col_idx]
-
-    s_ent = get_col_by_keyword(['entidade', 'cliente', 'nome', 'favorecido'])
-    s_cat = get_col_by_keyword(['categoria', 'classifica'])
-    s_conta = get_col_by_keyword(['conta', 'banco', 'origem'])
-
-    df_final = pd.DataFrame()
-    df_final["Data"] = s_data.apply(parse_pdf_data) if s_data is not None else str(date.today())
-    if s_desc is not None: df_final["Descrição"] = s_desc.astype(str).str.replace("\n", " ").fillna("")
-    else: df_final["Descrição"] = "Sem Descrição"
-    df_final["Valor"] = s_valor.apply(clean_currency) if s_valor is not None else 0.0
-    if s_ent is not None: df_final["Entidade"] = s_ent.astype(str).fillna("")
-    else: df_final["Entidade"] = df_final["Descrição"] 
-    df_final["Conta"] = s_conta.astype(str) if s_conta is not None else "Banco Principal"
-    df_final["Categoria"] = s_cat.astype(str) if s_cat is not None else "Geral"
-    for col in ["Conta", "Categoria", "Entidade", "Descrição"]:
-        df_final[col] = df_final[col].replace({"nan": "", "None": "", "Nb": "", "NaT": ""}).fillna("")
-    df_final = df_final[df_final["Valor"] != 0]
-    return df_final[["Conta", "Categoria", "Entidade", "Descrição", "Data", "Valor"]], "OK"
-
-def processar_arquivo_crm(file):
-    df = pd.DataFrame()
-    try:
-        if file.name.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
-        elif file.name.endswith('.csv'):
-            df = pd.read_csv(file)
-        else: return None, "Formato inválido (use Excel ou CSV)"
-    except Exception as e: return None, f"Erro ao ler: {e}"
-    
-    # Normalizar nomes das colunas
-    df.columns = [str(c).strip() for c in df.columns]
-    cols_lower = [c.lower() for c in df.columns]
-    
-    # Mapeamento inteligente
-    col_nome, col_cpf, col_email, col_tel, col_obs = None, None, None, None, None
-    
-    for i, col in enumerate(cols_lower):
-        if any(x in col for x in ['nome', 'cliente', 'name']): col_nome = df.columns[i]
-        elif any(x in col for x in ['cpf', 'cnpj', 'doc']): col_cpf = df.columns[i]
-        elif any(x in col for x in ['email', 'mail']): col_email = df.columns[i]
-        elif any(x in col for x in ['tel', 'cel', 'phone', 'whatsapp']): col_tel = df.columns[i]
-        elif any(x in col for x in ['obs', 'info']): col_obs = df.columns[i]
-        
-    if not col_nome: return None, "Coluna 'Nome' não encontrada."
-    
-    df_final = pd.DataFrame()
-    df_final['Nome'] = df[col_nome].astype(str).str.strip()
-    df_final['CPF'] = df[col_cpf].astype(str) if col_cpf else ""
-    df_final['Email'] = df[col_email].astype(str) if col_email else ""
-    df_final['Telefone'] = df[col_tel].astype(str) if col_tel else ""
-    df_final['Obs'] = df[col_obs].astype(str) if col_obs else "Importado"
-    df_final['Data_Cadastro'] = str(date.today())
-    
-    # Remove linhas sem nome
-    df_final = df_final[df_final['Nome'] != "nan"]
-    df_final = df_final[df_final['Nome'] != ""]
-    
-    return df_final, "OK"
-
-def classificar_lote_com_ia(df, api_key):
-    if not api_key: return df
-    try:
-        client = OpenAI(api_key=api_key)
-        descricoes = df["Descrição"].unique()[:40] 
-        lista = "\n".join([f"- {d}" for d in descricoes])
-        prompt = f"""
-        Analise estas descrições bancárias. Identifique:
-        1. Categoria (Ex: Alimentação, Transporte, Marketing, Fixo, Venda, Serviços).
-        2. Entidade (Nome da Loja, Pessoa ou Cliente).
-        Retorne no formato exato: Descrição -> Categoria | Entidade
-        Itens:
-        {lista}
-        """
-        resp = client.chat.completions.create(model="gpt-3.5-turbo", messages=[{"role": "user", "content": prompt}], temperature=0)
-        texto = resp.choices[0].message.content
-        mapa_cat, mapa_ent = {}, {}
-        for linha in texto.split("\n"):
-            if "->" in linha and "|" in linha:
-                pt1, pt2 = linha.split("->")
-                desc_key, (cat_val, ent_val) = pt1.strip("- ").strip(), pt2.split("|")
-                mapa_cat[desc_key], mapa_ent[desc_key] = cat_val.strip(), ent_val.strip()
-        df["Categoria"] = df["Descrição"].map(mapa_cat).fillna(df["Categoria"])
-        mask = (df["Entidade"] == "") | (df["Entidade"] == df["Descrição"])
-        df.loc[mask, "Entidade"] = df.loc[mask, "Descrição"].map(mapa_ent).fillna(df.loc[mask, "Entidade"])
-        return df
-    except Exception as e:
-        st.error(f"Erro IA: {e}")
-        return df
-
 def chat_ia(df_v, df_d, user_msg, key):
     if not key: return "⚠️ Configure sua API Key."
     try:
+        from openai import OpenAI
         client = OpenAI(api_key=key)
         contexto = f"Vendas recentes: {df_v.tail(5).to_string()}\nDespesas recentes: {df_d.tail(5).to_string()}"
         resp = client.chat.completions.create(model="gpt-3.5-turbo", messages=[{"role": "system", "content": f"Você é um analista financeiro. Contexto atual: {contexto}"}, {"role": "user", "content": user_msg}])
         return resp.choices[0].message.content
     except Exception as e: return f"Erro IA: {e}"
 
+@st.cache_resource(show_spinner=False)
+def pool_importacao():
+    return criar_pool_importacao()
+
+@st.cache_resource(show_spinner=False)
+def cache_importacao():
+    return CacheImportacao()
+
+@st.cache_resource(show_spinner=False)
+def modelo_local(tabela):
+    return ModeloLocal(tabela)
+
+def marcar_duplicados(df, tabela):
+    """Desmarca (coluna Importar) o que já está no banco ou se repete no próprio lote"""
+    imp = impressoes(df["Data"], df["Valor"], df["Descrição"], df["Conta"])
+    no_banco = imp.isin(impressoes_existentes(tabela, imp.unique()))
+    repetido = imp.duplicated() & ~no_banco
+    df.insert(0, "Importar", ~(no_banco | repetido))
+    df["Situação"] = np.select([no_banco, repetido], ["Já no banco", "Repetida no lote"], "Nova")
+    return df
+
+# Navegação da página ARQUIVOS
+TAMANHO_PAGINA_ARQUIVOS = 20
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def indice_pasta(caminho, mtime_pasta):
+    # mtime da pasta na chave: arquivo novo/apagado refaz o índice
+    return listar_pasta(caminho)
+
+def pagina_arquivos(total, key):
+    """(início, fim) da página escolhida; o seletor só aparece com mais de uma página"""
+    paginas = max(1, -(-total // TAMANHO_PAGINA_ARQUIVOS))
+    pagina = st.number_input(f"Página (de {paginas})", 1, paginas, 1, key=key) if paginas > 1 else 1
+    inicio = (pagina - 1) * TAMANHO_PAGINA_ARQUIVOS
+    return inicio, min(inicio + TAMANHO_PAGINA_ARQUIVOS, total)
+
+def linha_arquivo(nome, tamanho, data, ler, mime, key):
+    c_nome, c_info, c_baixar = st.columns([4, 2, 1])
+    c_nome.write(f"📄 {nome}")
+    c_info.caption(f"{tamanho / 1024:,.0f} KB · {data}")
+    c_baixar.download_button("📥", ler, file_name=nome, mime=mime, key=key)
+
+# Editores paginados (VENDAS, FINANCEIRO, CRM): só a página atual vai ao navegador e ao salvar
+TAMANHO_PAGINA_EDITOR = 50
+
+def filtro_da_tela(tabela, key_prefix, cols, periodo=(None, None)):
+    """WHERE do SQL equivalente aos filtros avançados escolhidos (mesmas chaves do session_state)"""
+    selecoes = {c: st.session_state.get(f"{key_prefix}_{c}") for c in cols}
+    return filtro_sql(tabela, periodo, st.session_state.get(f"{key_prefix}_search"), selecoes)
+
+def editor_paginado(tabela, colunas, where, params, ordenacoes, key, column_config=None):
+    """data_editor de uma página (keyset). Retorna (editado, página original) para o update_full_table"""
+    c_ordem, c_sentido = st.columns([3, 1])
+    ordem = c_ordem.selectbox("Ordenar por", ordenacoes, key=f"{key}_ordem")
+    desc = c_sentido.toggle("Decrescente", True, key=f"{key}_desc")
+
+    # Cursor do início de cada página visitada; filtro ou ordem novos voltam à primeira
+    assinatura = (where, params, ordem, desc)
+    if st.session_state.get(f"{key}_assinatura") != assinatura:
+        st.session_state[f"{key}_assinatura"] = assinatura
+        st.session_state[f"{key}_cursores"] = [None]
+    cursores = st.session_state[f"{key}_cursores"]
+    pagina, ha_mais = pagina_keyset(tabela, colunas, ordem, desc, cursores[-1], TAMANHO_PAGINA_EDITOR, where, params)
+    if pagina.empty and len(cursores) > 1:
+        cursores.pop(); st.rerun()
+
+    pagina.insert(0, "Excluir", False)
+    # Chave muda com a página e a versão da tabela: edições não "vazam" para outras linhas
+    ed = st.data_editor(pagina, hide_index=True, use_container_width=True, column_config=column_config,
+                        key=f"{key}_editor_{len(cursores)}_{versao_tabela(tabela)}")
+
+    c_ant, c_pag, c_prox = st.columns([1, 2, 1])
+    if c_ant.button("◀ Anterior", disabled=len(cursores) == 1, key=f"{key}_anterior"):
+        cursores.pop(); st.rerun()
+    c_pag.caption(f"Página {len(cursores)} · {len(pagina)} linhas")
+    if c_prox.button("Próxima ▶", disabled=not ha_mais, key=f"{key}_proxima"):
+        ultima = pagina.iloc[-1]
+        cursores.append((ultima[ordem], ultima["id"])); st.rerun()
+    return ed, pagina
+
+# Gráficos do Dashboard: série reamostrada e specs das figuras em cache
+MAX_PONTOS_SERIE = 120
+# (regra do pandas, dias por passo, rótulo): usa o menor passo que cabe em MAX_PONTOS_SERIE
+PASSOS_SERIE = [("D", 1, "dia"), ("W-MON", 7, "semana"), ("MS", 30.44, "mês"), ("QS", 91.31, "trimestre"), ("YS", 365.25, "ano")]
+
+def reamostrar_serie(datas, valores, max_pontos=MAX_PONTOS_SERIE):
+    """Soma dos valores por dia/semana/mês conforme o tamanho do período. Retorna (df Data/Valor, rótulo do passo)"""
+    serie = pd.Series(pd.to_numeric(valores, errors="coerce").to_numpy(), index=pd.to_datetime(datas, errors="coerce"))
+    serie = serie[serie.index.notna()]
+    if serie.empty:
+        return pd.DataFrame({"Data": pd.to_datetime([]), "Valor": []}), "dia"
+    dias = (serie.index.max() - serie.index.min()).days + 1
+    regra, _, rotulo = next((p for p in PASSOS_SERIE if dias / p[1] <= max_pontos), PASSOS_SERIE[-1])
+    serie = serie.resample(regra, label="left", closed="left").sum()
+    return serie.rename_axis("Data").reset_index(name="Valor"), rotulo
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def figuras_dashboard(chave, _df_r, fat, desp, meta, tema):
+    """Specs (dicts do Plotly) dos quatro gráficos. `chave` = (dados de onde _df_r veio, filtros);
+    tema = (cores, template, cor do texto, fundo do medidor)"""
+    marcar_miss()
+    # Plotly, openai, pdfplumber e openpyxl são importados na primeira função que os usa:
+    # a partida do app (login, páginas sem gráfico) não paga por eles
+    import plotly.express as px
+    import plotly.graph_objects as go
+    cores, template, txt, fundo_gauge = tema
+    figs = {}
+    if not _df_r.empty:
+        # O resumo grava o serviço NULL como '' (chave primária): fatia sem nome, como antes
+        mix = _df_r.groupby(_df_r["Servico"].replace("", None), dropna=False, as_index=False)["Valor"].sum()
+        fig_pie = px.pie(mix, names="Servico", values="Valor", hole=0.7, color_discrete_sequence=list(cores), template=template)
+        fig_pie.update_layout(showlegend=False, margin=dict(t=20, b=20, l=20, r=20), height=280, paper_bgcolor="rgba(0,0,0,0)")
+        fig_pie.add_annotation(text=format_brl(fat), showarrow=False, font_size=14, font_color=txt)
+        figs["pie"] = fig_pie.to_dict()
+
+        serie, passo = reamostrar_serie(_df_r["Data"], _df_r["Valor"])
+        fig_area = px.area(serie, x="Data", y="Valor", color_discrete_sequence=[cores[1]], template=template)
+        fig_area.update_layout(paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", margin=dict(t=10, b=10, l=10, r=10), height=280)
+        figs["area"], figs["passo"] = fig_area.to_dict(), passo
+
+    resumo = pd.DataFrame({"Tipo": ["Entradas", "Saídas"], "Valor": [fat, desp]})
+    fig_bar = px.bar(resumo, x="Tipo", y="Valor", color="Tipo", color_discrete_map={"Entradas": cores[0], "Saídas": cores[3]}, template=template, text_auto='.2s')
+    fig_bar.update_layout(paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", height=250, showlegend=False)
+    figs["bar"] = fig_bar.to_dict()
+
+    fig_gauge = go.Figure(go.Indicator(
+        mode = "gauge+number", value = fat, domain = {'x': [0, 1], 'y': [0, 1]},
+        gauge = {'axis': {'range': [None, meta]}, 'bar': {'color': cores[2]}, 'bgcolor': fundo_gauge}
+    ))
+    fig_gauge.update_layout(height=250, margin=dict(t=30, b=10), paper_bgcolor="rgba(0,0,0,0)", font={'color': txt})
+    figs["gauge"] = fig_gauge.to_dict()
+    return figs
+
+def processar_lote_com_progresso(arquivos, crm, progresso, digests=None, paralelo=True):
+    executor = pool_importacao() if paralelo else None
+    for n, item in enumerate(processar_lote(arquivos, crm, executor, cache_importacao(), digests), start=1):
+        progresso.progress(n / len(arquivos), text=f"Lido {item[1]} ({n}/{len(arquivos)})")
+        yield item
+
 # ==========================================
 # 7. BARRA LATERAL (COM LOGOUT)
 # ==========================================
+secao("7. barra lateral")
 with st.sidebar:
     # Cabeçalho com Info do Usuário
     st.title("💎 CMG Pro")
@@ -490,7 +441,9 @@ with st.sidebar:
     
     st.markdown("### Menu")
     menu_options = ["📊 DASHBOARD", "🧮 PRECIFICAÇÃO", "📇 CRM", "👥 VENDAS", "💰 FINANCEIRO", "📢 MURAL", "⚙️ CONFIG", "📂 ARQUIVOS", "🤖 I.A."]
+    if usuario_admin: menu_options.append("🩺 DIAGNÓSTICO")
     escolha_menu = st.radio("Ir para:", menu_options, label_visibility="collapsed")
+    anotar(pagina=escolha_menu)
     st.divider()
 
     st.markdown("### 📅 Filtros")
@@ -517,9 +470,14 @@ with st.sidebar:
 # ==========================================
 # 8. LÓGICA DE DADOS
 # ==========================================
-df_vendas_raw = load_data("vendas")
-df_despesas_raw = load_data("despesas")
-df_clientes_raw = load_data("clientes")
+secao("8. carga de dados")
+# Período do filtro lateral aplicado direto no SQL (índices em vendas/despesas.Data)
+if tipo_filtro != "Todo Histórico" and data_inicio and data_fim:
+    periodo = (data_inicio, data_fim)
+else:
+    periodo = (None, None)
+df_vendas = load_data("vendas", *periodo)
+df_despesas = load_data("despesas", *periodo)
 df_consultores = load_data("consultores")
 df_bancos = load_data("bancos")
 df_servicos = load_data("servicos")
@@ -530,23 +488,16 @@ meta_mensal = get_config('meta_mensal')
 meta_anual = get_config('meta_anual')
 
 # TRATAMENTO DE DADOS
-if not df_vendas_raw.empty:
-    df_vendas_raw['Data'] = pd.to_datetime(df_vendas_raw['Data'], errors='coerce').dt.date
-    df_vendas_raw['Valor'] = pd.to_numeric(df_vendas_raw['Valor'], errors='coerce').fillna(0.0)
-    if 'Empresa_Pagadora' not in df_vendas_raw.columns: df_vendas_raw['Empresa_Pagadora'] = ""
-
-if not df_despesas_raw.empty:
-    df_despesas_raw['Data'] = pd.to_datetime(df_despesas_raw['Data'], errors='coerce').dt.date
-    df_despesas_raw['Valor'] = pd.to_numeric(df_despesas_raw['Valor'], errors='coerce').fillna(0.0)
-    if 'Fornecedor' not in df_despesas_raw.columns: df_despesas_raw['Fornecedor'] = ""
+secao("8. tratamento de datas")
+if not df_vendas.empty:
+    df_vendas['Data'] = pd.to_datetime(df_vendas['Data'], errors='coerce').dt.date
+    df_vendas['Valor'] = pd.to_numeric(df_vendas['Valor'], errors='coerce').fillna(0.0)
+    if 'Empresa_Pagadora' not in df_vendas.columns: df_vendas['Empresa_Pagadora'] = ""
 
-# FILTRO DE DATA
-if tipo_filtro != "Todo Histórico" and data_inicio and data_fim:
-    df_vendas = df_vendas_raw[(df_vendas_raw['Data'] >= data_inicio) & (df_vendas_raw['Data'] <= data_fim)].copy() if not df_vendas_raw.empty else df_vendas_raw
-    df_despesas = df_despesas_raw[(df_despesas_raw['Data'] >= data_inicio) & (df_despesas_raw['Data'] <= data_fim)].copy() if not df_despesas_raw.empty else df_despesas_raw
-else:
-    df_vendas = df_vendas_raw.copy()
-    df_despesas = df_despesas_raw.copy()
+if not df_despesas.empty:
+    df_despesas['Data'] = pd.to_datetime(df_despesas['Data'], errors='coerce').dt.date
+    df_despesas['Valor'] = pd.to_numeric(df_despesas['Valor'], errors='coerce').fillna(0.0)
+    if 'Fornecedor' not in df_despesas.columns: df_despesas['Fornecedor'] = ""
 
 lista_consultores = df_consultores["Nome"].tolist() if not df_consultores.empty else ["Geral"]
 lista_bancos = df_bancos["Banco"].tolist() if not df_bancos.empty else ["Caixa Principal"]
@@ -567,6 +518,7 @@ else:
 # ==========================================
 # 9. ROTEAMENTO
 # ==========================================
+secao(f"9. {escolha_menu}")
 
 # --- DASHBOARD ---
 if escolha_menu == "📊 DASHBOARD":
@@ -585,17 +537,24 @@ if escolha_menu == "📊 DASHBOARD":
                     st.info(f"**{row['Titulo']}** ({row['Data']}) - {row['Mensagem']}")
 
     # --- FILTRO AVANÇADO GLOBAL PARA O DASHBOARD ---
-    df_v = df_vendas.copy()
-    if not df_v.empty:
-        df_v = renderizar_filtros_avancados(df_v, 
-                                            multiselect_cols=["Consultor", "Servico", "Status_Pagamento", "Conta_Recebimento"], 
-                                            search_cols=["Cliente", "CPF", "Empresa_Pagadora"],
-                                            key_prefix="dash")
-    
-    fat = df_v["Valor"].sum() if not df_v.empty else 0
-    desp = df_despesas["Valor"].sum() if not df_despesas.empty else 0
+    # KPIs e gráficos saem dos resumos diários (dia x dimensões), não das vendas linha a linha
+    cols_dash = ["Consultor", "Servico", "Status_Pagamento", "Conta_Recebimento"]
+    busca_dash = ["Cliente", "CPF", "Empresa_Pagadora"]
+    df_r = load_data("resumo_vendas_diario", *periodo)
+    df_rd = load_data("resumo_despesas_diario", *periodo)
+    if not df_r.empty:
+        df_r = renderizar_filtros_avancados(df_r,
+                                            multiselect_cols=cols_dash,
+                                            search_cols=busca_dash,
+                                            key_prefix="dash",
+                                            versao=chave_dados("resumo_vendas_diario", *periodo),
+                                            busca_detalhe=lambda termo: agregar_resumo(filtrar_por_texto(df_vendas, busca_dash, termo, "vendas"), "resumo_vendas_diario"))
+
+    fat = df_r["Valor"].sum() if not df_r.empty else 0
+    desp = df_rd["Valor"].sum() if not df_rd.empty else 0
+    qtd_vendas = df_r["Qtd"].sum() if not df_r.empty else 0
     lucro = fat - desp
-    ticket = fat / len(df_v) if len(df_v) > 0 else 0
+    ticket = fat / qtd_vendas if qtd_vendas > 0 else 0
     
     st.caption(f"Período: {tipo_filtro}")
     c1, c2, c3, c4 = st.columns(4)
@@ -605,41 +564,32 @@ if escolha_menu == "📊 DASHBOARD":
     c4.metric("Ticket Médio", format_brl(ticket))
 
     st.markdown("<br>", unsafe_allow_html=True)
+    # Figuras refeitas só quando mudam os dados, os filtros, a meta ou o tema
+    filtros_dash = tuple(tuple(st.session_state.get(f"dash_{c}") or ()) for c in cols_dash) + (st.session_state.get("dash_search"),)
+    tema_dash = (tuple(cor_grafico), plotly_template, txt_chart, "#2D3748" if st.session_state.theme == "Escuro" else "#E5E7EB")
+    with span("plotly: figuras do dashboard", cache="hit"):
+        figs = figuras_dashboard((chave_dados("resumo_vendas_diario", *periodo), filtros_dash), df_r, fat, desp, meta_mensal, tema_dash)
+
     g1, g2 = st.columns([1, 2])
     with g1:
         st.markdown("**Mix de Serviços**")
-        if not df_v.empty:
-            fig_pie = px.pie(df_v, names="Servico", values="Valor", hole=0.7, color_discrete_sequence=cor_grafico, template=plotly_template)
-            fig_pie.update_layout(showlegend=False, margin=dict(t=20, b=20, l=20, r=20), height=280, paper_bgcolor="rgba(0,0,0,0)")
-            fig_pie.add_annotation(text=f"R$ {fat:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."), showarrow=False, font_size=14, font_color=txt_chart)
-            st.plotly_chart(fig_pie, use_container_width=True)
+        if "pie" in figs: st.plotly_chart(figs["pie"], use_container_width=True)
         else: st.info("Sem dados")
     with g2:
         st.markdown("**Evolução Financeira**")
-        if not df_v.empty:
-            daily = df_v.groupby("Data")["Valor"].sum().reset_index()
-            daily['Data'] = pd.to_datetime(daily['Data'])
-            fig_area = px.area(daily, x="Data", y="Valor", color_discrete_sequence=[cor_grafico[1]], template=plotly_template)
-            fig_area.update_layout(paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", margin=dict(t=10, b=10, l=10, r=10), height=280)
-            st.plotly_chart(fig_area, use_container_width=True)
+        if "area" in figs:
+            st.plotly_chart(figs["area"], use_container_width=True)
+            st.caption(f"Total por {figs['passo']}")
         else: st.info("Sem dados")
     
     st.markdown("<br>", unsafe_allow_html=True)
     g3, g4 = st.columns([2, 1])
     with g3:
         st.markdown("**Fluxo de Caixa**")
-        resumo = pd.DataFrame({"Tipo": ["Entradas", "Saídas"], "Valor": [fat, desp]})
-        fig_bar = px.bar(resumo, x="Tipo", y="Valor", color="Tipo", color_discrete_map={"Entradas": cor_grafico[0], "Saídas": cor_grafico[3]}, template=plotly_template, text_auto='.2s')
-        fig_bar.update_layout(paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", height=250, showlegend=False)
-        st.plotly_chart(fig_bar, use_container_width=True)
+        st.plotly_chart(figs["bar"], use_container_width=True)
     with g4:
         st.markdown("**Meta Mensal**")
-        fig_gauge = go.Figure(go.Indicator(
-            mode = "gauge+number", value = fat, domain = {'x': [0, 1], 'y': [0, 1]},
-            gauge = {'axis': {'range': [None, meta_mensal]}, 'bar': {'color': cor_grafico[2]}, 'bgcolor': "#2D3748" if st.session_state.theme == "Escuro" else "#E5E7EB"}
-        ))
-        fig_gauge.update_layout(height=250, margin=dict(t=30, b=10), paper_bgcolor="rgba(0,0,0,0)", font={'color': txt_chart})
-        st.plotly_chart(fig_gauge, use_container_width=True)
+        st.plotly_chart(figs["gauge"], use_container_width=True)
 
 # --- PRECIFICAÇÃO ---
 elif escolha_menu == "🧮 PRECIFICAÇÃO":
@@ -666,10 +616,7 @@ elif escolha_menu == "🧮 PRECIFICAÇÃO":
 elif escolha_menu == "📇 CRM":
     st.markdown("## 📇 Clientes")
     busca_crm = st.text_input("🔍 Buscar Cliente...", placeholder="Nome ou CPF")
-    df_c = df_clientes_raw.copy()
-    if busca_crm and not df_c.empty:
-        mask = df_c.astype(str).apply(lambda x: x.str.lower().str.contains(busca_crm.lower())).any(axis=1)
-        df_c = df_c[mask]
+    where_c, params_c = filtro_sql("clientes", termo=busca_crm)
 
     c1, c2 = st.columns([1, 2])
     with c1:
@@ -683,32 +630,40 @@ elif escolha_menu == "📇 CRM":
                 obs = st.text_area("Obs")
                 if st.form_submit_button("Salvar"):
                     if n:
-                        run_query("INSERT INTO clientes (Nome, CPF, Email, Telefone, Data_Cadastro, Obs) VALUES (?,?,?,?,?,?)", (n, cpf, email, tel, str(date.today()), obs))
+                        run_query(SQL_UPSERT_CLIENTE, params_cliente(n, cpf, email, tel, str(date.today()), obs), tabelas=["clientes"])
                         st.success("Salvo!"); st.rerun()
                     else: st.error("Erro")
     with c2:
-        st.markdown(f"#### Base ({len(df_c)})")
-        if not df_c.empty:
-            if "Excluir" not in df_c.columns: df_c.insert(0, "Excluir", False)
-            ed = st.data_editor(df_c, hide_index=True, use_container_width=True, column_config={"id": st.column_config.NumberColumn(disabled=True)})
+        qtd_c, = totais_filtro("clientes", where_c, params_c)
+        st.markdown(f"#### Base ({qtd_c})")
+        repetidos, = totais_filtro("clientes", "Duplicado_de IS NOT NULL")
+        if repetidos:
+            st.warning(f"{repetidos} cliente(s) repetido(s) marcado(s) em Duplicado_de (id do cadastro mantido): revise e apague.")
+        if qtd_c:
+            with conexao() as conn: cols_c = colunas_tabela(conn, "clientes")
+            ed, pagina_c = editor_paginado("clientes", cols_c, where_c, params_c, ["Nome", "Data_Cadastro", "CPF", "id"], "crm",
+                                           column_config={"id": st.column_config.NumberColumn(disabled=True)})
             if st.button("💾 Atualizar CRM"):
-                update_full_table(ed, "clientes"); st.rerun()
+                try: update_full_table(ed, "clientes", pagina_c); st.rerun()
+                except sqlite3.IntegrityError: st.error("Já existe um cliente com esse CPF/nome.")
 
 # --- VENDAS ---
 elif escolha_menu == "👥 VENDAS":
     st.markdown("## 👥 Vendas")
     
     # --- FILTRO AVANÇADO VENDAS (Texto + Multiselect) ---
-    df_v = df_vendas.copy()
+    df_v = df_vendas
     if not df_v.empty:
         df_v = renderizar_filtros_avancados(df_v, 
                                             multiselect_cols=["Consultor", "Servico", "Status_Pagamento", "Conta_Recebimento"], 
                                             search_cols=["Cliente", "CPF", "Empresa_Pagadora"],
-                                            key_prefix="vendas")
+                                            key_prefix="vendas",
+                                            tabela="vendas",
+                                            versao=chave_dados("vendas", *periodo))
         
-        # Mostra totais filtrados
-        f_total = df_v["Valor"].sum()
-        f_qtd = len(df_v)
+        # Totais filtrados (consulta agregada no banco, com os mesmos filtros do editor)
+        where_v, params_v = filtro_da_tela("vendas", "vendas", ["Consultor", "Servico", "Status_Pagamento", "Conta_Recebimento"], periodo)
+        f_qtd, f_total = totais_filtro("vendas", where_v, params_v, ["Valor"])
         c_tot1, c_tot2 = st.columns(2)
         c_tot1.metric("Total Filtrado", format_brl(f_total))
         c_tot2.metric("Qtd. Vendas", f_qtd)
@@ -745,48 +700,46 @@ elif escolha_menu == "👥 VENDAS":
                 
                 if st.form_submit_button("Salvar Venda"):
                     if cli:
-                        qtd = salvar_arquivos(docs, cli)
+                        qtd = len(docs or [])
                         empresa_final = pag if pag else cli
                         
-                        run_query("INSERT INTO vendas (Data, Consultor, Cliente, CPF, Email, Telefone, Servico, Valor, Status_Pagamento, Conta_Recebimento, Obs, Docs, Empresa_Pagadora) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", 
-                                  (str(date.today()), cons, cli, cpf, email, tel, serv, val, stt, cnt, obs, f"{qtd} arqs", empresa_final))
-                        
-                        exists = False
-                        if not df_clientes_raw.empty:
-                            if cli in df_clientes_raw['Nome'].values: exists = True
-                        if not exists:
-                            run_query("INSERT INTO clientes (Nome, CPF, Email, Telefone, Data_Cadastro, Obs) VALUES (?,?,?,?,?,?)", (cli, cpf, email, tel, str(date.today()), "Auto Venda"))
+                        # Arquivos copiados antes: a transação (BEGIN IMMEDIATE) não espera o disco
+                        blobs = gravar_uploads(docs)
+                        # Venda + cliente (upsert pela chave normalizada) + documentos numa transação só
+                        with transacao() as conn:
+                            cur = conn.execute("INSERT INTO vendas (Data, Consultor, Cliente, CPF, Email, Telefone, Servico, Valor, Status_Pagamento, Conta_Recebimento, Obs, Docs, Empresa_Pagadora) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", 
+                                               (str(date.today()), cons, cli, cpf, email, tel, serv, val, stt, cnt, obs, f"{qtd} arqs", empresa_final))
+                            params = params_cliente(cli, cpf, email, tel, str(date.today()), "Auto Venda")
+                            conn.execute(SQL_UPSERT_CLIENTE, params)
+                            salvar_documentos(conn, blobs, cur.lastrowid, id_cliente(conn, params))
+                            invalidar_tabelas(conn, "vendas", "clientes", "documentos")
                         st.toast("Salvo!"); st.rerun()
     with c2:
         st.markdown("#### Histórico de Vendas")
-        if not df_v.empty:
-            if "Excluir" not in df_v.columns: df_v.insert(0, "Excluir", False)
-            df_v_editor = df_v.copy()
-            if 'Data' in df_v_editor.columns: df_v_editor['Data'] = df_v_editor['Data'].astype(str)
-            
-            # Reordenar
-            cols_order = ["Excluir", "Data", "Cliente", "Empresa_Pagadora", "Servico", "Valor", "Status_Pagamento", "Consultor", "Conta_Recebimento", "id"]
-            cols_existentes = [c for c in cols_order if c in df_v_editor.columns]
-            df_v_editor = df_v_editor[cols_existentes]
-
-            ed_v = st.data_editor(df_v_editor, hide_index=True, use_container_width=True, column_config={"id": st.column_config.NumberColumn(disabled=True)})
+        if not df_v.empty and f_qtd:
+            cols_order = ["Data", "Cliente", "Empresa_Pagadora", "Servico", "Valor", "Status_Pagamento", "Consultor", "Conta_Recebimento", "id"]
+            ed_v, df_v_editor = editor_paginado("vendas", cols_order, where_v, params_v, ["Data", "Valor", "Cliente", "id"], "vendas_editor",
+                                                column_config={"id": st.column_config.NumberColumn(disabled=True)})
             if st.button("💾 Atualizar Vendas"):
-                update_full_table(ed_v, "vendas"); st.rerun()
+                update_full_table(ed_v, "vendas", df_v_editor); st.rerun()
 
 # --- FINANCEIRO ---
 elif escolha_menu == "💰 FINANCEIRO":
     st.markdown("## 💰 Financeiro")
     
     # --- FILTRO AVANÇADO FINANCEIRO (Texto + Multiselect) ---
-    df_d = df_despesas.copy()
+    df_d = df_despesas
     if not df_d.empty:
         df_d = renderizar_filtros_avancados(df_d, 
                                             multiselect_cols=["Categoria", "Conta_Origem"],
                                             search_cols=["Descricao", "Fornecedor"],
-                                            key_prefix="fin")
+                                            key_prefix="fin",
+                                            tabela="despesas",
+                                            versao=chave_dados("despesas", *periodo))
         
-        # Mostra totais filtrados
-        d_total = df_d["Valor"].sum()
+        # Totais filtrados (consulta agregada no banco, com os mesmos filtros do editor)
+        where_d, params_d = filtro_da_tela("despesas", "fin", ["Categoria", "Conta_Origem"], periodo)
+        d_qtd, d_total = totais_filtro("despesas", where_d, params_d, ["Valor"])
         st.metric("Total Despesas Filtradas", format_brl(d_total), delta="Saída", delta_color="inverse")
         st.divider()
 
@@ -811,19 +764,11 @@ elif escolha_menu == "💰 FINANCEIRO":
                 st.toast("Salvo!"); st.rerun()
     with c2:
         st.markdown("#### Despesas")
-        if not df_d.empty:
-            if "Excluir" not in df_d.columns: df_d.insert(0, "Excluir", False)
-            df_d_editor = df_d.copy()
-            if 'Data' in df_d_editor.columns: df_d_editor['Data'] = df_d_editor['Data'].astype(str)
-            
-            # Reordenar
-            cols_order = ["Excluir", "Data", "Descricao", "Fornecedor", "Categoria", "Valor", "Conta_Origem", "id"]
-            cols_existentes = [c for c in cols_order if c in df_d_editor.columns]
-            df_d_editor = df_d_editor[cols_existentes]
-            
-            ed_d = st.data_editor(df_d_editor, hide_index=True, use_container_width=True)
+        if not df_d.empty and d_qtd:
+            cols_order = ["Data", "Descricao", "Fornecedor", "Categoria", "Valor", "Conta_Origem", "id"]
+            ed_d, df_d_editor = editor_paginado("despesas", cols_order, where_d, params_d, ["Data", "Valor", "Fornecedor", "id"], "fin_editor")
             if st.button("💾 Atualizar Finanças"):
-                 update_full_table(ed_d, "despesas"); st.rerun()
+                 update_full_table(ed_d, "despesas", df_d_editor); st.rerun()
 
 # --- MURAL ---
 elif escolha_menu == "📢 MURAL":
@@ -859,7 +804,7 @@ elif escolha_menu == "📢 MURAL":
             with st.expander("Gerenciar Histórico Completo (Excluir)"):
                 ed_mural = st.data_editor(df_m_edit, hide_index=True, use_container_width=True, key="editor_mural")
                 if st.button("💾 Atualizar Mural"):
-                    update_full_table(ed_mural, "mural"); st.rerun()
+                    update_full_table(ed_mural, "mural", df_m_edit); st.rerun()
         else: st.info("Nenhum aviso no mural ainda.")
 
 # --- CONFIG ---
@@ -874,17 +819,20 @@ elif escolha_menu == "⚙️ CONFIG":
             if check_reset:
                 if st.button("🗑️ EXCLUIR TUDO AGORA", type="primary"):
                     try:
-                        with sqlite3.connect(DB_NAME) as conn:
+                        with transacao() as conn:
                             c = conn.cursor()
-                            tables_to_clear = ["vendas", "despesas", "clientes", "consultores", "bancos", "servicos", "config", "mural", "categorias_despesas"]
+                            tables_to_clear = ["vendas", "despesas", "clientes", "consultores", "bancos", "servicos", "config", "mural", "categorias_despesas", "documentos"]
                             for t in tables_to_clear:
                                 try: c.execute(f"DELETE FROM {t}")
                                 except: pass
-                            conn.commit()
+                            semear_padroes(c)
+                            invalidar_tabelas(conn, *tables_to_clear)
                         if os.path.exists(BASE_DIR_ARQUIVOS):
                             shutil.rmtree(BASE_DIR_ARQUIVOS)
                             os.makedirs(BASE_DIR_ARQUIVOS)
-                        st.cache_data.clear()
+                        # Snapshots do .db e backups Excel: cópias dos dados apagados (recriados sob demanda)
+                        for pasta in (DIR_SNAPSHOTS, DIR_EXPORTACAO):
+                            if os.path.exists(pasta): shutil.rmtree(pasta)
                         st.session_state.clear()
                         st.success("♻️ SISTEMA FORMATADO COM SUCESSO!"); time.sleep(2); st.rerun()
                     except Exception as e: st.error(f"Erro ao resetar: {e}")
@@ -900,34 +848,38 @@ elif escolha_menu == "⚙️ CONFIG":
                 with st.form("add_s"):
                     ns = st.text_input("Novo Serviço")
                     if st.form_submit_button("Add") and ns: 
-                        run_query("INSERT INTO servicos (Nome) VALUES (?)", (ns,)); st.rerun()
+                        run_query("INSERT OR IGNORE INTO servicos (Nome) VALUES (?)", (ns,)); st.rerun()
                 if not df_servicos.empty: 
                     if "Excluir" not in df_servicos.columns: df_servicos.insert(0, "Excluir", False)
                     ed_s = st.data_editor(df_servicos, hide_index=True, key="editor_servicos")
-                    if st.button("Salvar Serviços"): update_full_table(ed_s, "servicos"); st.rerun()
+                    if st.button("Salvar Serviços"):
+                        try: update_full_table(ed_s, "servicos", df_servicos); st.rerun()
+                        except sqlite3.IntegrityError: st.error("Já existe um serviço com esse nome.")
 
             # --- NOVO: CATEGORIAS (DESPESA) ---
             with st.expander("Categorias (Despesa)", expanded=False):
                 with st.form("add_cd"):
                     ncd = st.text_input("Nova Categoria")
                     if st.form_submit_button("Add") and ncd: 
-                        run_query("INSERT INTO categorias_despesas (Nome) VALUES (?)", (ncd,)); st.rerun()
+                        run_query("INSERT OR IGNORE INTO categorias_despesas (Nome) VALUES (?)", (ncd,)); st.rerun()
                 if not df_cat_despesas.empty: 
                     if "Excluir" not in df_cat_despesas.columns: df_cat_despesas.insert(0, "Excluir", False)
                     ed_cd = st.data_editor(df_cat_despesas, hide_index=True, key="editor_cat_despesas")
-                    if st.button("Salvar Categorias"): update_full_table(ed_cd, "categorias_despesas"); st.rerun()
+                    if st.button("Salvar Categorias"):
+                        try: update_full_table(ed_cd, "categorias_despesas", df_cat_despesas); st.rerun()
+                        except sqlite3.IntegrityError: st.error("Já existe uma categoria com esse nome.")
 
             with st.expander("Consultores"):
                 with st.form("add_c"):
                     nm = st.text_input("Novo Consultor")
                     if st.form_submit_button("Add") and nm: 
-                        run_query("INSERT INTO consultores (Nome) VALUES (?)", (nm,)); st.rerun()
+                        run_query("INSERT OR IGNORE INTO consultores (Nome) VALUES (?)", (nm,)); st.rerun()
                 if not df_consultores.empty: st.dataframe(df_consultores, hide_index=True)
             with st.expander("Contas Bancárias"):
                 with st.form("add_b"):
                     nb = st.text_input("Novo Banco")
                     if st.form_submit_button("Add") and nb: 
-                        run_query("INSERT INTO bancos (Banco) VALUES (?)", (nb,)); st.rerun()
+                        run_query("INSERT OR IGNORE INTO bancos (Banco) VALUES (?)", (nb,)); st.rerun()
                 if not df_bancos.empty: st.dataframe(df_bancos, hide_index=True)
         with col_sistema:
             st.markdown("#### 🖥️ Sistema")
@@ -942,10 +894,22 @@ elif escolha_menu == "⚙️ CONFIG":
                     set_config('meta_mensal', m_mensal); set_config('meta_anual', m_anual); st.success("Salvo!"); st.rerun()
     with tab_backup:
         st.markdown("#### 📥 Exportar")
-        excel_data = converter_para_excel({"Vendas": df_vendas_raw, "Despesas": df_despesas_raw, "Clientes": df_clientes_raw, "Servicos": df_servicos, "Mural": df_mural})
-        st.download_button("📊 Baixar Excel Completo", excel_data, f"Backup_{date.today()}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        # Gerado só no clique (e reaproveitado enquanto as tabelas não mudarem)
+        st.download_button("📊 Baixar Excel Completo", backup_excel, f"Backup_{date.today()}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
         st.divider()
-        with open(DB_NAME, "rb") as fp: st.download_button("🗄️ Baixar Banco (.db)", fp, f"backup_{DB_NAME}", "application/x-sqlite3")
+        # O download sai do último snapshot (cópia consistente), nunca do arquivo em uso
+        c_snap, c_gz = st.columns([1, 1])
+        comprimir = c_gz.toggle("Comprimir (.gz)", value=True)
+        if c_snap.button("📸 Novo Snapshot"):
+            with st.spinner("Copiando banco..."): criar_snapshot(comprimir)
+        snapshots = listar_snapshots()
+        if snapshots:
+            ultimo = snapshots[0]
+            st.caption(f"Último snapshot: {datetime.fromtimestamp(os.path.getmtime(ultimo)).strftime('%d/%m/%Y %H:%M')} "
+                       f"({os.path.getsize(ultimo) / 1e6:.1f} MB) — {len(snapshots)} guardados")
+            st.download_button("🗄️ Baixar Banco (.db)", lambda: ler_arquivo(ultimo), os.path.basename(ultimo),
+                               "application/gzip" if ultimo.endswith(".gz") else "application/x-sqlite3")
+        else: st.info("Nenhum snapshot ainda. Gere um para baixar o banco.")
     with tab_import:
         st.markdown("### 📥 Importação em Lote")
         st.info("Suporta múltiplos arquivos (PDF/Excel) de uma só vez.")
@@ -955,34 +919,38 @@ elif escolha_menu == "⚙️ CONFIG":
         
         uploaded_files = st.file_uploader("Arraste seus arquivos aqui", type=["pdf", "xlsx", "xls", "csv"], accept_multiple_files=True)
         if uploaded_files:
-            upload_id = str(sorted([f.name for f in uploaded_files]))
+            # SHA-256 de cada upload calculado uma vez (por file_id) e guardado na sessão, não a cada rerun
+            memo_digests = st.session_state.get("digests_upload", {})
+            digests = [memo_digests.get(f.file_id) or sha256_arquivo(f.getvalue()) for f in uploaded_files]
+            st.session_state.digests_upload = {f.file_id: d for f, d in zip(uploaded_files, digests)}
+            # Conteúdo dos arquivos + tipo de lançamento (renomear não conta, trocar o tipo sim)
+            upload_id = str((tipo_arq, digests))
             
             # Reset se mudar os arquivos
             if "df_preview" not in st.session_state or st.session_state.get("upload_id") != upload_id:
-                lista_dfs_processados = []
                 erros_leitura = []
                 progresso = st.progress(0, text="Lendo arquivos...")
                 total_arquivos = len(uploaded_files)
+                arquivos = [(f.name, f.getvalue()) for f in uploaded_files]
+                resultados = [None] * total_arquivos
                 
-                for i, file in enumerate(uploaded_files):
-                    progresso.progress((i + 1) / total_arquivos, text=f"Lendo {file.name}...")
-                    
-                    if "Clientes" in tipo_arq:
-                        # Processamento CRM
-                        df_res, msg = processar_arquivo_crm(file)
-                    else:
-                        # Processamento Financeiro
-                        df_res, msg = processar_arquivo_inteligente(file)
-                        if df_res is not None and not df_res.empty:
-                             if "Despesas" in tipo_arq: df_res["Valor"] = df_res["Valor"].abs()
-
+                # Arquivos lidos em paralelo (processos); resultados juntados na ordem do upload
+                try: lote = list(processar_lote_com_progresso(arquivos, "Clientes" in tipo_arq, progresso, digests))
+                except BrokenProcessPool:
+                    pool_importacao.clear()
+                    lote = list(processar_lote_com_progresso(arquivos, "Clientes" in tipo_arq, progresso, digests, paralelo=False))
+                for i, nome, df_res, msg in sorted(lote, key=lambda x: x[0]):
                     if df_res is not None and not df_res.empty:
-                        lista_dfs_processados.append(df_res)
-                    else: erros_leitura.append(f"{file.name}: {msg}")
+                        if "Despesas" in tipo_arq: df_res["Valor"] = df_res["Valor"].abs()
+                        resultados[i] = df_res
+                    else: erros_leitura.append(f"{nome}: {msg}")
+                lista_dfs_processados = [r for r in resultados if r is not None]
                     
                 progresso.empty()
                 if lista_dfs_processados:
                     df_final_preview = pd.concat(lista_dfs_processados, ignore_index=True)
+                    if "Clientes" not in tipo_arq:
+                        df_final_preview = marcar_duplicados(df_final_preview, "vendas" if "Receitas" in tipo_arq else "despesas")
                     st.session_state.df_preview = df_final_preview
                     st.session_state.upload_id = upload_id
                     if erros_leitura: st.warning(f"Alguns arquivos não foram lidos: {', '.join(erros_leitura)}")
@@ -997,8 +965,12 @@ elif escolha_menu == "⚙️ CONFIG":
                     c_ia, c_limpar = st.columns([1, 4])
                     if c_ia.button("✨ Completar Tudo com IA"):
                         with st.spinner("Classificando..."):
-                            df_p = classificar_lote_com_ia(df_p, openai_key)
-                            st.session_state.df_preview = df_p; st.rerun()
+                            modelo = modelo_local("vendas" if "Receitas" in tipo_arq else "despesas")
+                            try: df_p, erros_ia = classificar_lote_com_ia(df_p, openai_key, modelo=modelo)
+                            except Exception as e: df_p, erros_ia = df_p, [str(e)]
+                            st.session_state.df_preview = df_p
+                        if erros_ia: st.error(f"Erro IA: {'; '.join(erros_ia)}")
+                        else: st.rerun()
                     if c_limpar.button("Limpar Tudo"):
                         del st.session_state["df_preview"]
                         if "upload_id" in st.session_state: del st.session_state["upload_id"]
@@ -1009,17 +981,25 @@ elif escolha_menu == "⚙️ CONFIG":
                         del st.session_state["upload_id"]
                         st.rerun()
 
-                edited_df = st.data_editor(df_p, num_rows="dynamic", use_container_width=True)
+                if "Importar" in df_p.columns and not df_p["Importar"].all():
+                    st.warning(f"{(~df_p['Importar']).sum()} linha(s) já estão no banco ou se repetem no lote e foram desmarcadas.")
+                edited_df = st.data_editor(df_p, num_rows="dynamic", use_container_width=True,
+                                           column_config={"Situação": st.column_config.TextColumn(disabled=True)})
                 
                 if st.button(f"✅ Confirmar Importação"):
                     try:
-                        with sqlite3.connect(DB_NAME) as conn:
+                        tabela_modelo = None
+                        if "Importar" in edited_df.columns:
+                            edited_df = edited_df[edited_df["Importar"].fillna(True).astype(bool)].copy()
+                        with transacao() as conn:
                             if "Clientes" in tipo_arq:
                                 # Salva Clientes
                                 df_b = edited_df.copy()
                                 # Garante que as colunas batem com o banco
                                 df_b = df_b[["Nome", "CPF", "Email", "Telefone", "Data_Cadastro", "Obs"]]
-                                df_b.to_sql("clientes", conn, if_exists="append", index=False)
+                                # Clientes já cadastrados (mesma chave) só são completados
+                                conn.executemany(SQL_UPSERT_CLIENTE, (params_cliente(*linha) for linha in df_b.astype(object).where(df_b.notna(), None).itertuples(index=False)))
+                                invalidar_tabelas(conn, "clientes")
                                 
                             elif "Receitas" in tipo_arq:
                                 # Salva Vendas
@@ -1035,6 +1015,8 @@ elif escolha_menu == "⚙️ CONFIG":
                                 df_b["Consultor"] = "Importação em Lote"
                                 df_b["Status_Pagamento"] = "Pago Total"
                                 df_b.to_sql("vendas", conn, if_exists="append", index=False)
+                                invalidar_tabelas(conn, "vendas")
+                                tabela_modelo = "vendas"
                             else:
                                 # Salva Despesas
                                 edited_df['Data'] = edited_df['Data'].astype(str)
@@ -1046,26 +1028,51 @@ elif escolha_menu == "⚙️ CONFIG":
                                 df_b["Fornecedor"] = edited_df["Entidade"]
                                 df_b["Valor"] = edited_df["Valor"]
                                 df_b.to_sql("despesas", conn, if_exists="append", index=False)
+                                invalidar_tabelas(conn, "despesas")
+                                tabela_modelo = "despesas"
                                 
+                        # O modelo local aprende as linhas confirmadas (só as novas)
+                        if tabela_modelo: modelo_local(tabela_modelo).acrescentar_importados()
                         st.success(f"Sucesso!")
                         del st.session_state["df_preview"]
                         del st.session_state["upload_id"]
-                        st.cache_data.clear(); st.rerun()
+                        st.rerun()
                     except Exception as e: st.error(f"Erro ao salvar: {e}")
 
 # --- ARQUIVOS ---
 elif escolha_menu == "📂 ARQUIVOS":
     st.markdown("## 📂 Arquivos")
+    # Só metadados na tela; os bytes são lidos no clique de cada download (ou do zip)
+    clientes_docs = clientes_com_documentos()
+    if clientes_docs:
+        opcoes = {f"{nome} ({qtd})": (cid, nome, qtd) for cid, nome, qtd in clientes_docs}
+        sel_cli = st.selectbox("Cliente", ["--"] + list(opcoes))
+        if sel_cli != "--":
+            cid, nome_cli, qtd = opcoes[sel_cli]
+            inicio, fim = pagina_arquivos(qtd, "pag_docs")
+            for doc_id, nome, tamanho, mime, hash_doc, venda_id, data in documentos_do_cliente(cid, fim - inicio, inicio):
+                linha_arquivo(nome, tamanho, data, lambda h=hash_doc: ler_documento(h), mime, f"doc_{doc_id}")
+            st.download_button(f"📦 Baixar tudo ({qtd}) em .zip",
+                               lambda: zip_arquivos([(d[1], caminho_blob(d[4])) for d in documentos_do_cliente(cid)]),
+                               f"{nome_cli}.zip", "application/zip")
+        st.divider()
+
+    st.markdown("#### Pastas antigas")
     col_busca, col_sel = st.columns([1, 2])
     with col_busca: busca = st.text_input("Filtro Pasta")
-    pastas = [f for f in os.listdir(BASE_DIR_ARQUIVOS) if os.path.isdir(os.path.join(BASE_DIR_ARQUIVOS, f))]
+    pastas = [f for f in os.listdir(BASE_DIR_ARQUIVOS) if os.path.isdir(os.path.join(BASE_DIR_ARQUIVOS, f)) and not f.startswith("_")]
     if busca: pastas = [p for p in pastas if busca.lower() in p.lower()]
     with col_sel: sel = st.selectbox("Selecione", ["--"] + pastas)
     if sel != "--":
         path = os.path.join(BASE_DIR_ARQUIVOS, sel)
-        for arq in os.listdir(path):
-            with open(os.path.join(path, arq), "rb") as f:
-                st.download_button(f"📥 {arq}", f, file_name=arq)
+        arquivos = indice_pasta(path, os.stat(path).st_mtime_ns)
+        inicio, fim = pagina_arquivos(len(arquivos), "pag_pasta")
+        for nome, tamanho, mtime, mime in arquivos[inicio:fim]:
+            caminho = os.path.join(path, nome)
+            linha_arquivo(nome, tamanho, datetime.fromtimestamp(mtime).strftime('%d/%m/%Y'), lambda c=caminho: ler_arquivo(c), mime, f"arq_{sel}_{nome}")
+        if arquivos:
+            st.download_button(f"📦 Baixar tudo ({len(arquivos)}) em .zip",
+                               lambda: zip_arquivos([(n, os.path.join(path, n)) for n, *_ in arquivos]), f"{sel}.zip", "application/zip")
 
 # --- IA ---
 elif escolha_menu == "🤖 I.A.":
@@ -1077,4 +1084,35 @@ elif escolha_menu == "🤖 I.A.":
         st.chat_message("user").write(prompt)
         res = chat_ia(df_vendas, df_despesas, prompt, openai_key)
         st.session_state.msgs.append({"role": "assistant", "content": res})
-        st.chat_message("assistant").write(res)
\ No newline at end of file
+        st.chat_message("assistant").write(res)
+
+# --- DIAGNÓSTICO (só admin) ---
+elif escolha_menu == "🩺 DIAGNÓSTICO" and usuario_admin:
+    st.markdown("## 🩺 Diagnóstico")
+    registros = ler_registros()
+    if not registros:
+        st.info("Nenhum rerun registrado ainda.")
+    else:
+        df_diag = pd.DataFrame(registros)
+        reruns = df_diag["rerun"].unique()
+        janela = st.selectbox("Considerar", [100, 500, 2000, "Todos"], format_func=lambda n: f"Últimos {n} reruns" if n != "Todos" else "Todo o log")
+        if janela != "Todos": df_diag = df_diag[df_diag["rerun"].isin(reruns[-janela:])]
+        if "pagina" in df_diag.columns:
+            paginas = st.multiselect("Páginas", sorted(df_diag["pagina"].dropna().unique()))
+            if paginas: df_diag = df_diag[df_diag["pagina"].isin(paginas)]
+
+        # Tempo do rerun = soma das seções
+        por_rerun = df_diag[df_diag["tipo"] == "secao"].groupby("rerun")["ms"].sum()
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Reruns", len(por_rerun))
+        c2.metric("Rerun p50", f"{por_rerun.quantile(0.5):,.0f} ms" if len(por_rerun) else "-")
+        c3.metric("Rerun p95", f"{por_rerun.quantile(0.95):,.0f} ms" if len(por_rerun) else "-")
+
+        st.markdown("#### Por seção/span (p50/p95)")
+        st.dataframe(resumo_spans(df_diag), hide_index=True, use_container_width=True,
+                     column_config={"acerto_cache": st.column_config.ProgressColumn("acerto_cache", min_value=0, max_value=1)})
+        st.markdown("#### Mais lentos")
+        cols_lentos = [c for c in ["ts", "pagina", "usuario", "span", "ms", "linhas", "cache"] if c in df_diag.columns]
+        st.dataframe(df_diag.nlargest(20, "ms")[cols_lentos], hide_index=True, use_container_width=True)
+
+finalizar_rerun()
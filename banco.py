@@ -0,0 +1,742 @@
+"""Camada de banco de dados do CMG System (SQLite).
+
+Conexões, migrações de schema, cache versionado por tabela e persistência
+das edições feitas nos st.data_editor.
+"""
+import gzip
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import string
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime, date, timedelta
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from diagnostico import span, cronometrado, marcar_miss
+
+DB_NAME = 'cmg_system.db'
+
+# ==========================================
+# CONEXÕES (WAL + POOL)
+# ==========================================
+# Journal WAL: leitores não bloqueiam o escritor (e vice-versa).
+# busy_timeout: espera o lock em vez de falhar com "database is locked".
+PRAGMAS_CONEXAO = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",   # ~20 MB de cache de páginas por conexão
+    "PRAGMA temp_store=MEMORY",
+)
+
+class PoolConexoes:
+    """Pool thread-safe de conexões SQLite.
+
+    Cada thread (sessão do Streamlit) pega uma conexão livre e a devolve ao
+    final; dentro da mesma thread o uso é reentrante (reaproveita a conexão).
+    """
+    def __init__(self, caminho, tamanho=8):
+        self.caminho = caminho
+        self.tamanho = tamanho
+        self._livres = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._criadas = 0
+
+    def _nova_conexao(self):
+        conn = sqlite3.connect(self.caminho, timeout=5, check_same_thread=False)
+        for pragma in PRAGMAS_CONEXAO:
+            conn.execute(pragma)
+        return conn
+
+    def _obter(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            criar = self._criadas < self.tamanho
+            if criar: self._criadas += 1
+        if criar:
+            return self._nova_conexao()
+        return self._livres.get(timeout=30)
+
+    @contextmanager
+    def conexao(self):
+        atual = getattr(self._local, "conn", None)
+        if atual is not None:
+            yield atual
+            return
+        conn = self._obter()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction: conn.rollback()
+            self._livres.put(conn)
+
+@st.cache_resource(show_spinner=False)
+def pool_conexoes():
+    init_db()
+    return PoolConexoes(DB_NAME)
+
+def conexao():
+    """Conexão do pool para leitura: `with conexao() as conn:`"""
+    return pool_conexoes().conexao()
+
+@contextmanager
+def transacao():
+    """Transação de escrita (BEGIN IMMEDIATE): commit no fim, rollback em erro"""
+    with conexao() as conn:
+        if conn.in_transaction:
+            # Já dentro de uma transação desta thread: participa dela
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+# ==========================================
+# MIGRAÇÕES & CACHE VERSIONADO
+# ==========================================
+# --- MIGRAÇÕES (PRAGMA user_version) ---
+# Cada passo roda uma única vez por banco, em ordem. Para alterar o schema,
+# acrescente uma nova função ao final de MIGRACOES (nunca edite as antigas).
+def _colunas(c, tabela):
+    return {r[1] for r in c.execute(f"PRAGMA table_info({tabela})").fetchall()}
+
+def colunas_tabela(conn, tabela):
+    """Colunas na ordem do schema, sem as geradas (Impressao, Chave...): table_info não as lista"""
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({tabela})").fetchall()]
+
+def semear_padroes(c):
+    """Serviços, categorias e metas padrão quando as tabelas estão vazias"""
+    if c.execute("SELECT count(*) FROM servicos").fetchone()[0] == 0:
+        padroes = [("Limpeza Nome",), ("Score",), ("Consultoria",), ("Jurídico",)]
+        c.executemany("INSERT INTO servicos (Nome) VALUES (?)", padroes)
+    if c.execute("SELECT count(*) FROM categorias_despesas").fetchone()[0] == 0:
+        cats_padrao = [("Fixo",), ("Comissões",), ("Marketing",), ("Impostos",), ("Pessoal",), ("Transporte",)]
+        c.executemany("INSERT INTO categorias_despesas (Nome) VALUES (?)", cats_padrao)
+    c.execute("INSERT OR IGNORE INTO config (chave, valor) VALUES ('meta_mensal', '50000')")
+    c.execute("INSERT OR IGNORE INTO config (chave, valor) VALUES ('meta_anual', '600000')")
+
+# Bancos gravados pelo antigo to_sql(if_exists='replace') do editor: "id" INTEGER/REAL
+# sem PRIMARY KEY (o id das linhas novas fica NULL). O SQLite não muda a chave por
+# ALTER TABLE, então a tabela é refeita a partir das colunas do PRAGMA table_xinfo.
+TABELAS_COM_ID = ["clientes", "consultores", "bancos", "servicos", "categorias_despesas", "vendas", "despesas", "mural"]
+
+def _id_canonico(c, tabela):
+    return any(nome == "id" and tipo.upper() == "INTEGER" and pk == 1
+               for _, nome, tipo, _, _, pk in c.execute(f"PRAGMA table_info({tabela})").fetchall())
+
+def _reconstruir_com_id(c, tabela):
+    info = c.execute(f"PRAGMA table_xinfo({tabela})").fetchall()
+    if any(r[6] for r in info):
+        raise sqlite3.DatabaseError(f"{tabela}: colunas ocultas/geradas, o id não pode ser refeito automaticamente")
+    colunas = [(r[1], r[2]) for r in info if r[1] != "id"]
+    cols = ", ".join(f'"{nome}"' for nome, _ in colunas)
+    id_antigo = "CAST(id AS INTEGER)" if len(colunas) < len(info) else "NULL"
+    c.execute(f"CREATE TABLE {tabela}_nova (id INTEGER PRIMARY KEY AUTOINCREMENT"
+              + "".join(f', "{nome}" {tipo}' for nome, tipo in colunas) + ")")
+    # Ids NULL ou repetidos entram por último, sem id: recebem os seguintes ao maior
+    c.execute(f"INSERT INTO {tabela}_nova (id, {cols}) SELECT CASE WHEN n = 1 THEN id END, {cols} FROM ("
+              f"SELECT {id_antigo} AS id, ROW_NUMBER() OVER (PARTITION BY {id_antigo} ORDER BY rowid) AS n, rowid AS linha, {cols} "
+              f"FROM {tabela}) ORDER BY id IS NULL OR n > 1, id, linha")
+    c.execute(f"DROP TABLE {tabela}")
+    c.execute(f"ALTER TABLE {tabela}_nova RENAME TO {tabela}")
+    if not _id_canonico(c, tabela):
+        raise sqlite3.DatabaseError(f"{tabela}: id continua sem PRIMARY KEY depois de refeita")
+
+def corrigir_ids(c):
+    for tabela in TABELAS_COM_ID:
+        if not _id_canonico(c, tabela): _reconstruir_com_id(c, tabela)
+
+def _migracao_001_schema_base(c):
+    c.execute('CREATE TABLE IF NOT EXISTS clientes (id INTEGER PRIMARY KEY AUTOINCREMENT, Nome TEXT, CPF TEXT, Email TEXT, Telefone TEXT, Data_Cadastro TEXT, Obs TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS consultores (id INTEGER PRIMARY KEY AUTOINCREMENT, Nome TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS bancos (id INTEGER PRIMARY KEY AUTOINCREMENT, Banco TEXT, Agencia TEXT, Conta TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS servicos (id INTEGER PRIMARY KEY AUTOINCREMENT, Nome TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS categorias_despesas (id INTEGER PRIMARY KEY AUTOINCREMENT, Nome TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS config (chave TEXT PRIMARY KEY, valor TEXT)')
+    c.execute('''CREATE TABLE IF NOT EXISTS vendas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, Data TEXT, Consultor TEXT, Cliente TEXT, CPF TEXT, 
+        Servico TEXT, Valor REAL, Status_Pagamento TEXT, Conta_Recebimento TEXT, Obs TEXT, Docs TEXT, 
+        Email TEXT, Telefone TEXT, Empresa_Pagadora TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS despesas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, Data TEXT, Categoria TEXT, Descricao TEXT, 
+        Conta_Origem TEXT, Valor REAL, Fornecedor TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS mural (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, Data TEXT, Titulo TEXT, Mensagem TEXT, Tipo TEXT, Autor TEXT
+    )''')
+
+    # Bancos antigos, criados antes destas colunas existirem
+    for tabela, colunas in [("vendas", ["Email", "Telefone", "Obs", "Conta_Recebimento", "Empresa_Pagadora"]),
+                            ("despesas", ["Conta_Origem", "Fornecedor"])]:
+        existentes = _colunas(c, tabela)
+        for col in colunas:
+            if col not in existentes: c.execute(f"ALTER TABLE {tabela} ADD COLUMN {col} TEXT")
+    # Antes dos índices e da deduplicação das próximas migrações, que dependem do id
+    corrigir_ids(c)
+
+    semear_padroes(c)
+
+def _migracao_002_versoes_e_periodo(c):
+    # Versão (geração) de cada tabela: usada como chave do cache do load_data
+    c.execute('CREATE TABLE IF NOT EXISTS versoes_tabelas (tabela TEXT PRIMARY KEY, versao INTEGER NOT NULL DEFAULT 0)')
+    # Índices para o filtro de período (WHERE Data >= ? AND Data < ?)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_vendas_data ON vendas (Data)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_despesas_data ON despesas (Data)')
+
+def _migracao_003_indices_e_restricoes(c):
+    # Cadastros auxiliares sem registros repetidos: sai só a cópia igual em todas as colunas
+    # (fica a mais antiga); contas do mesmo banco com outra agência/conta continuam
+    for tabela, cols in [("servicos", ["Nome"]), ("categorias_despesas", ["Nome"]), ("consultores", ["Nome"]),
+                         ("bancos", ["Banco", "Agencia", "Conta"])]:
+        chave = ", ".join(cols)
+        c.execute(f"DELETE FROM {tabela} WHERE id NOT IN (SELECT MIN(id) FROM {tabela} GROUP BY {chave})")
+        c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{tabela}_{cols[0].lower()} ON {tabela} ({chave})")
+    c.execute('CREATE INDEX IF NOT EXISTS idx_clientes_nome ON clientes (Nome)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_clientes_cpf ON clientes (CPF)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_vendas_cliente ON vendas (Cliente)')
+
+# Resumos diários materializados (Dashboard): tabela -> (origem, dimensões).
+# Mantidos por triggers em todo INSERT/UPDATE/DELETE da tabela de origem.
+RESUMOS = {
+    "resumo_vendas_diario": ("vendas", ["Servico", "Consultor", "Status_Pagamento", "Conta_Recebimento"]),
+    "resumo_despesas_diario": ("despesas", ["Categoria", "Conta_Origem"]),
+}
+
+def _sql_triggers_resumo(resumo, origem, dims):
+    chaves = ", ".join(["Data"] + dims)
+    def valores(ref):
+        return [f"substr(COALESCE({ref}.Data, ''), 1, 10)"] + [f"COALESCE({ref}.{d}, '')" for d in dims]
+    def somar(ref):
+        return (f"INSERT INTO {resumo} ({chaves}, Qtd, Valor) VALUES ({', '.join(valores(ref))}, 1, CAST(COALESCE({ref}.Valor, 0) AS REAL)) "
+                f"ON CONFLICT ({chaves}) DO UPDATE SET Qtd = Qtd + 1, Valor = Valor + excluded.Valor;")
+    def subtrair(ref):
+        onde = " AND ".join(f"{k} = {v}" for k, v in zip(["Data"] + dims, valores(ref)))
+        return (f"UPDATE {resumo} SET Qtd = Qtd - 1, Valor = Valor - CAST(COALESCE({ref}.Valor, 0) AS REAL) WHERE {onde}; "
+                f"DELETE FROM {resumo} WHERE {onde} AND Qtd <= 0;")
+    colunas = ", ".join(["Data", "Valor"] + dims)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{origem}_resumo_ins AFTER INSERT ON {origem} BEGIN {somar('NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{origem}_resumo_del AFTER DELETE ON {origem} BEGIN {subtrair('OLD')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{origem}_resumo_upd AFTER UPDATE OF {colunas} ON {origem} BEGIN {subtrair('OLD')} {somar('NEW')} END",
+    ]
+
+def _migracao_004_resumos_diarios(c):
+    for resumo, (origem, dims) in RESUMOS.items():
+        cols_dims = ", ".join(f"{d} TEXT NOT NULL" for d in dims)
+        c.execute(f"CREATE TABLE IF NOT EXISTS {resumo} (Data TEXT NOT NULL, {cols_dims}, "
+                  f"Qtd INTEGER NOT NULL, Valor REAL NOT NULL, PRIMARY KEY (Data, {', '.join(dims)}))")
+        for sql in _sql_triggers_resumo(resumo, origem, dims):
+            c.execute(sql)
+        # Carga inicial a partir das linhas já existentes
+        exprs = ", ".join([f"COALESCE({d}, '')" for d in dims])
+        c.execute(f"DELETE FROM {resumo}")
+        c.execute(f"INSERT INTO {resumo} (Data, {', '.join(dims)}, Qtd, Valor) "
+                  f"SELECT substr(COALESCE(Data, ''), 1, 10), {exprs}, COUNT(*), SUM(CAST(COALESCE(Valor, 0) AS REAL)) "
+                  f"FROM {origem} GROUP BY 1, {', '.join(str(i + 2) for i in range(len(dims)))}")
+
+# Índices de busca textual (FTS5, sem acento e por prefixo): tabela -> colunas.
+# Tabelas FTS "contentless" mantidas por triggers; quando há CPF, a coluna extra
+# Documento guarda só os dígitos para achar "12345678900" e "123.456.789-00".
+BUSCAS = {
+    "clientes": ["Nome", "CPF", "Email", "Telefone", "Obs"],
+    "vendas": ["Cliente", "CPF", "Empresa_Pagadora"],
+    "despesas": ["Descricao", "Fornecedor"],
+}
+
+def _sql_digitos(expr):
+    for ch in (".", "-", "/", " "):
+        expr = f"replace({expr}, '{ch}', '')"
+    return expr
+
+def _colunas_busca(tabela):
+    cols = BUSCAS[tabela]
+    return cols + (["Documento"] if "CPF" in cols else [])
+
+def _valores_busca(tabela, ref):
+    valores = [f"{ref}.{c}" for c in BUSCAS[tabela]]
+    if "CPF" in BUSCAS[tabela]:
+        valores.append(_sql_digitos(f"COALESCE({ref}.CPF, '')"))
+    return ", ".join(valores)
+
+def _migracao_005_busca_textual(c):
+    for tabela in BUSCAS:
+        fts = f"busca_{tabela}"
+        cols = ", ".join(_colunas_busca(tabela))
+        c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='', "
+                  f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        inserir = f"INSERT INTO {fts} (rowid, {cols}) VALUES (NEW.id, {_valores_busca(tabela, 'NEW')});"
+        remover = f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', OLD.id, {_valores_busca(tabela, 'OLD')});"
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{tabela}_busca_ins AFTER INSERT ON {tabela} BEGIN {inserir} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{tabela}_busca_del AFTER DELETE ON {tabela} BEGIN {remover} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{tabela}_busca_upd AFTER UPDATE OF {', '.join(BUSCAS[tabela])} ON {tabela} "
+                  f"BEGIN {remover} {inserir} END")
+        c.execute(f"INSERT INTO {fts} (rowid, {cols}) SELECT id, {_valores_busca(tabela, tabela)} FROM {tabela}")
+
+def _migracao_006_memo_classificacao(c):
+    # Respostas da I.A. por descrição bancária (chave normalizada): consultadas antes de chamar a API
+    c.execute('''CREATE TABLE IF NOT EXISTS classificacoes_ia (
+        Chave TEXT PRIMARY KEY, Descricao TEXT, Categoria TEXT, Entidade TEXT, Data TEXT
+    )''')
+
+# Impressão digital dos lançamentos (Data|centavos|descrição|conta): coluna gerada
+# pelo próprio SQLite e indexada, para achar na hora o que já foi importado.
+# Minúsculas só em ASCII, como o lower() do SQLite
+_MINUSCULAS_ASCII = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+IMPRESSOES = {"vendas": ("Obs", "Conta_Recebimento"), "despesas": ("Descricao", "Conta_Origem")}
+
+def _sql_impressao(desc, conta):
+    def texto(col): return f"lower(trim(COALESCE({col}, '')))"
+    return (f"substr(COALESCE(Data, ''), 1, 10) || '|' || COALESCE(CAST(ROUND(Valor * 100) AS INTEGER), '') "
+            f"|| '|' || {texto(desc)} || '|' || {texto(conta)}")
+
+def _migracao_007_impressao_digital(c):
+    for tabela, (desc, conta) in IMPRESSOES.items():
+        c.execute(f"ALTER TABLE {tabela} ADD COLUMN Impressao TEXT GENERATED ALWAYS AS ({_sql_impressao(desc, conta)}) VIRTUAL")
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_impressao ON {tabela} (Impressao)")
+
+# Chave do cliente: os dígitos do CPF (11) ou CNPJ (14) ou, sem documento válido
+# ("nan", "N/A", incompleto...), o nome sem acentos e em minúsculas. Coluna gerada
+# com índice único: o upsert da venda acha o cliente em O(log n).
+# O parser do SQLite limita o aninhamento de replace(), por isso o nome é normalizado
+# em duas colunas encadeadas: Nome_Minusculo (maiúsculas acentuadas -> minúsculas,
+# lower()) e Nome_Chave (tira os acentos).
+ACENTOS = "áàâãéêíóôõúüçñ"
+SEM_ACENTOS = "aaaaeeiooouucn"
+
+def _sql_trocar(expr, de, para):
+    for a, b in zip(de, para):
+        expr = f"replace({expr}, '{a}', '{b}')"
+    return expr
+
+def _sql_chave_cliente():
+    # Documento válido: sem os separadores, só [0-9] e com 11 ou 14 dígitos
+    digitos = _sql_digitos("COALESCE(CPF, '')")
+    return (f"CASE WHEN length({digitos}) IN (11, 14) AND {digitos} NOT GLOB '*[^0-9]*' "
+            f"THEN {digitos} ELSE Nome_Chave END")
+
+def _migracao_008_chave_cliente(c):
+    minusculo = "lower(" + _sql_trocar("trim(COALESCE(Nome, ''))", ACENTOS.upper(), ACENTOS) + ")"
+    nome_chave = f"NULLIF({_sql_trocar('Nome_Minusculo', ACENTOS, SEM_ACENTOS)}, '')"
+    c.execute(f"ALTER TABLE clientes ADD COLUMN Nome_Minusculo TEXT GENERATED ALWAYS AS ({minusculo}) VIRTUAL")
+    c.execute(f"ALTER TABLE clientes ADD COLUMN Nome_Chave TEXT GENERATED ALWAYS AS ({nome_chave}) VIRTUAL")
+    c.execute(f"ALTER TABLE clientes ADD COLUMN Chave TEXT GENERATED ALWAYS AS ({_sql_chave_cliente()}) VIRTUAL")
+    c.execute("ALTER TABLE clientes ADD COLUMN Duplicado_de INTEGER")
+    c.execute("CREATE INDEX idx_clientes_chave_tmp ON clientes (Chave)")
+    # Clientes repetidos não são apagados: o mais antigo é completado com os dados dos
+    # demais (só campos vazios) e os outros ficam marcados em Duplicado_de, para revisão
+    for col in ("Email", "Telefone", "Obs"):
+        c.execute(f"""UPDATE clientes SET {col} = COALESCE((
+                          SELECT d.{col} FROM clientes d WHERE d.Chave = clientes.Chave AND COALESCE(d.{col}, '') <> '' ORDER BY d.id LIMIT 1), {col})
+                      WHERE COALESCE({col}, '') = '' AND id IN (SELECT MIN(id) FROM clientes WHERE Chave IS NOT NULL GROUP BY Chave HAVING COUNT(*) > 1)""")
+    c.execute("""UPDATE clientes SET Duplicado_de = (SELECT MIN(d.id) FROM clientes d WHERE d.Chave = clientes.Chave)
+                 WHERE Chave IS NOT NULL AND id > (SELECT MIN(d.id) FROM clientes d WHERE d.Chave = clientes.Chave)""")
+    c.execute("DROP INDEX idx_clientes_chave_tmp")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_clientes_chave ON clientes (Chave) WHERE Duplicado_de IS NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_clientes_nome_chave ON clientes (Nome_Chave)")
+
+def _migracao_009_documentos(c):
+    # Índice dos documentos anexados (os arquivos ficam em blobs, ver documentos.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS documentos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, Hash TEXT NOT NULL, Nome TEXT, Tamanho INTEGER, Mime TEXT,
+        Venda_id INTEGER, Cliente_id INTEGER, Data TEXT
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_documentos_cliente ON documentos (Cliente_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_documentos_venda ON documentos (Venda_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_documentos_hash ON documentos (Hash)')
+
+MIGRACOES = [
+    _migracao_001_schema_base,
+    _migracao_002_versoes_e_periodo,
+    _migracao_003_indices_e_restricoes,
+    _migracao_004_resumos_diarios,
+    _migracao_005_busca_textual,
+    _migracao_006_memo_classificacao,
+    _migracao_007_impressao_digital,
+    _migracao_008_chave_cliente,
+    _migracao_009_documentos,
+]
+
+# Cadastro do cliente sem duplicar: se a chave já existe, só completa Email/Telefone vazios.
+# Sem CPF, um cliente de mesmo nome cadastrado com CPF já conta (não cria outro).
+# Os marcados em Duplicado_de (ver migração 008) ficam fora da busca.
+SQL_UPSERT_CLIENTE = ("INSERT INTO clientes (Nome, CPF, Email, Telefone, Data_Cadastro, Obs) SELECT ?, ?, ?, ?, ?, ? "
+                      "WHERE ? <> '' OR NOT EXISTS (SELECT 1 FROM clientes WHERE Nome_Chave = ? AND Chave <> Nome_Chave) "
+                      "ON CONFLICT(Chave) WHERE Duplicado_de IS NULL DO UPDATE SET Email = COALESCE(NULLIF(clientes.Email, ''), excluded.Email), "
+                      "Telefone = COALESCE(NULLIF(clientes.Telefone, ''), excluded.Telefone)")
+
+# Mesmas normalizações das colunas geradas, em Python (para os parâmetros do upsert)
+_MAIUSCULAS_ACENTO = str.maketrans(ACENTOS.upper(), ACENTOS)
+_SEM_ACENTO = str.maketrans(ACENTOS, SEM_ACENTOS)
+
+def digitos_documento(cpf):
+    """Dígitos do CPF/CNPJ como na coluna Chave; "" quando não é um documento válido"""
+    digitos = "" if cpf is None else str(cpf)
+    for ch in (".", "-", "/", " "):
+        digitos = digitos.replace(ch, "")
+    return digitos if len(digitos) in (11, 14) and all(ch in string.digits for ch in digitos) else ""
+
+def params_cliente(nome, cpf, email, tel, data_cadastro, obs):
+    """Parâmetros de SQL_UPSERT_CLIENTE"""
+    nome_chave = str(nome or "").strip(" ").translate(_MAIUSCULAS_ACENTO).translate(_MINUSCULAS_ASCII).translate(_SEM_ACENTO)
+    return (nome, cpf, email, tel, data_cadastro, obs, digitos_documento(cpf), nome_chave or None)
+
+def id_cliente(conn, params):
+    """id do cliente gravado por SQL_UPSERT_CLIENTE com estes parâmetros"""
+    digitos, nome_chave = params[6], params[7]
+    if digitos:
+        res = conn.execute("SELECT id FROM clientes WHERE Chave = ? AND Duplicado_de IS NULL", (digitos,)).fetchone()
+    else:
+        # Sem CPF: o cadastrado só pelo nome ou, se não houver, o de mesmo nome com CPF
+        res = conn.execute("SELECT id FROM clientes WHERE Nome_Chave = ? AND Duplicado_de IS NULL ORDER BY Chave = Nome_Chave DESC, id LIMIT 1", (nome_chave,)).fetchone()
+    return res[0] if res else None
+
+def aplicar_migracoes(conn):
+    """Aplica só os passos pendentes; cada passo + user_version numa transação"""
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    for numero, migracao in enumerate(MIGRACOES[versao:], start=versao + 1):
+        c = conn.cursor()
+        c.execute("BEGIN")
+        try:
+            migracao(c)
+            c.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        versao = numero
+    return versao
+
+@st.cache_resource(show_spinner=False)
+def init_db():
+    """Roda uma vez por processo (e não a cada rerun do Streamlit)"""
+    # Verifica se o arquivo existe e se é válido (tenta conectar)
+    if os.path.exists(DB_NAME):
+        try:
+            with closing(sqlite3.connect(DB_NAME)) as conn:
+                conn.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+        except sqlite3.DatabaseError:
+            # Se der erro, apaga o arquivo corrompido para criar um novo
+            print("Banco de dados corrompido detectado. Recriando...")
+            os.remove(DB_NAME)
+    with closing(sqlite3.connect(DB_NAME)) as conn:
+        return aplicar_migracoes(conn)
+
+# --- VERSIONAMENTO DO CACHE POR TABELA ---
+# Só no começo de cada comando: o "DO UPDATE SET" de um upsert não é um UPDATE da tabela "SET"
+RE_TABELAS_ESCRITA = re.compile(r'(?:^|;)\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM|REPLACE\s+INTO)\s+(\w+)', re.IGNORECASE)
+
+def tabelas_da_query(query):
+    """Tabelas escritas por um INSERT/UPDATE/DELETE (com WITH na frente, passe tabelas= ao run_query)"""
+    return sorted(set(RE_TABELAS_ESCRITA.findall(query)))
+
+def invalidar_tabelas(conn, *tabelas):
+    """Incrementa a versão das tabelas (na mesma transação da escrita)"""
+    conn.executemany("INSERT INTO versoes_tabelas (tabela, versao) VALUES (?, 1) "
+                     "ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1", [(t,) for t in tabelas])
+
+def versao_tabela(table_name):
+    with conexao() as conn:
+        res = conn.execute("SELECT versao FROM versoes_tabelas WHERE tabela=?", (table_name,)).fetchone()
+    return res[0] if res else 0
+
+@cronometrado()
+def run_query(query, params=(), tabelas=None):
+    with transacao() as conn:
+        conn.execute(query, params)
+        invalidar_tabelas(conn, *(tabelas or tabelas_da_query(query)))
+
+def chave_dados(table_name, data_inicio=None, data_fim=None):
+    """(tabela, versão, período): identifica o conteúdo retornado por load_data"""
+    # Os resumos diários seguem a versão da tabela de origem
+    periodo = (str(data_inicio), str(data_fim)) if data_inicio and data_fim else None
+    origem = RESUMOS[table_name][0] if table_name in RESUMOS else table_name
+    return (table_name, versao_tabela(origem), periodo)
+
+# Período [início, fim] como Data >= início AND Data < fim + 1 dia: Data é TEXT e o
+# BETWEEN perdia as linhas 'AAAA-MM-DD hh:mm:ss' do último dia
+SQL_PERIODO = "Data >= ? AND Data < ?"
+
+def params_periodo(data_inicio, data_fim):
+    fim = date.fromisoformat(str(data_fim)[:10]) + timedelta(days=1)
+    return (str(data_inicio)[:10], str(fim))
+
+def load_data(table_name, data_inicio=None, data_fim=None):
+    # A versão entra na chave do cache: só a tabela alterada é recarregada
+    with span(f"load_data:{table_name}", cache="hit") as reg:
+        df = _load_data_cached(*chave_dados(table_name, data_inicio, data_fim))
+        reg["linhas"] = len(df)
+    return df
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _load_data_cached(table_name, versao, periodo=None):
+    marcar_miss()
+    with conexao() as conn:
+        try:
+            # Sem as colunas geradas: só servem aos índices e custam caro para calcular em toda linha
+            cols = ", ".join(colunas_tabela(conn, table_name)) or "*"
+            if periodo:
+                df = pd.read_sql(f"SELECT {cols} FROM {table_name} WHERE {SQL_PERIODO}", conn, params=params_periodo(*periodo))
+            else:
+                df = pd.read_sql(f"SELECT {cols} FROM {table_name}", conn)
+        except:
+            df = pd.DataFrame() 
+    return df
+
+def get_config(chave):
+    with conexao() as conn:
+        res = conn.execute("SELECT valor FROM config WHERE chave=?", (chave,)).fetchone()
+    try: return float(res[0]) if res else 0.0
+    except: return 0.0
+
+def set_config(chave, valor):
+    with transacao() as conn:
+        conn.execute("INSERT OR REPLACE INTO config (chave, valor) VALUES (?, ?)", (chave, str(valor)))
+        invalidar_tabelas(conn, "config")
+
+def _valor_sql(v):
+    """Converte valores do pandas/numpy para tipos aceitos pelo sqlite3"""
+    if v is None: return None
+    try:
+        if pd.isna(v): return None
+    except (TypeError, ValueError): pass
+    if isinstance(v, (datetime, date)): return str(v)
+    if hasattr(v, "item"): return v.item()
+    return v
+
+def calcular_alteracoes(df_original, df_editado, colunas):
+    """Compara a saída do st.data_editor com as linhas exibidas.
+    Retorna (ids_excluir, alteracoes) onde alteracoes = {(colunas alteradas): [(valores..., id), ...]}"""
+    editado = df_editado[df_editado["id"].notna()].copy()
+    editado["id"] = editado["id"].astype(int)
+    if "Excluir" in editado.columns:
+        marcados = editado["Excluir"].fillna(False).astype(bool)
+        ids_excluir = editado.loc[marcados, "id"].tolist()
+        editado = editado[~marcados]
+    else:
+        ids_excluir = []
+
+    colunas = [c for c in colunas if c in editado.columns]
+    novo = editado.set_index("id")[colunas]
+    if df_original is None or df_original.empty or "id" not in df_original.columns:
+        # Sem referência: considera todas as células exibidas como alteradas
+        mascara = pd.DataFrame(True, index=novo.index, columns=colunas)
+    else:
+        original = df_original[df_original["id"].notna()].copy()
+        original["id"] = original["id"].astype(int)
+        original = original.set_index("id").reindex(index=novo.index, columns=colunas)
+        iguais = (novo.astype(object) == original.astype(object)) | (novo.isna() & original.isna())
+        mascara = ~iguais
+
+    alteracoes = {}
+    linhas = mascara.index[mascara.to_numpy().any(axis=1)] if colunas else []
+    for id_linha in linhas:
+        flags = mascara.loc[id_linha].to_numpy()
+        cols = tuple(c for c, f in zip(colunas, flags) if f)
+        valores = tuple(_valor_sql(novo.at[id_linha, c]) for c in cols)
+        alteracoes.setdefault(cols, []).append(valores + (int(id_linha),))
+    return ids_excluir, alteracoes
+
+def update_full_table(df_edited_view, table_name, df_original_view=None):
+    """Persiste apenas as linhas alteradas/excluídas no editor (UPDATE/DELETE em uma única transação)"""
+    with span(f"update_full_table:{table_name}") as reg, transacao() as conn:
+        colunas = [c for c in colunas_tabela(conn, table_name) if c != "id"]
+        ids_excluir, alteracoes = calcular_alteracoes(df_original_view, df_edited_view, colunas)
+        c = conn.cursor()
+        if ids_excluir:
+            c.executemany(f"DELETE FROM {table_name} WHERE id=?", [(i,) for i in ids_excluir])
+        for cols, params in alteracoes.items():
+            sets = ", ".join(f"{col}=?" for col in cols)
+            c.executemany(f"UPDATE {table_name} SET {sets} WHERE id=?", params)
+        if ids_excluir or alteracoes:
+            invalidar_tabelas(conn, table_name)
+        reg["linhas"] = len(ids_excluir) + sum(len(p) for p in alteracoes.values())
+    return reg["linhas"]
+
+# --- EDITORES PAGINADOS (KEYSET) ---
+def filtro_sql(tabela, periodo=(None, None), termo=None, selecoes=None):
+    """WHERE (e parâmetros) dos filtros da tela: período, busca FTS e valores escolhidos por coluna"""
+    conds, params = [], []
+    if periodo[0] and periodo[1]:
+        conds.append(SQL_PERIODO); params += params_periodo(*periodo)
+    if termo:
+        consulta = termo_fts(termo)
+        if consulta is None: conds.append("0")
+        else:
+            conds.append(f"id IN (SELECT rowid FROM busca_{tabela} WHERE busca_{tabela} MATCH ?)"); params.append(consulta)
+    for col, valores in (selecoes or {}).items():
+        if valores:
+            conds.append(f"{col} IN ({', '.join('?' * len(valores))})"); params += list(valores)
+    return " AND ".join(conds) or "1", tuple(params)
+
+def pagina_keyset(tabela, colunas, ordem="Data", desc=True, apos=None, limite=50, where="1", params=()):
+    """Página ordenada por (ordem, id) que começa depois de `apos` = (valor, id) da última linha
+    da página anterior. Retorna (df, há_mais). Sem OFFSET: cada página custa o mesmo (índice).
+    NULL fica no fim da ordem decrescente e no início da crescente, como no ORDER BY do SQLite"""
+    op, sentido = ("<", "DESC") if desc else (">", "ASC")
+    trechos = [False, True] if desc else [True, False]   # False = valores, True = NULLs
+    if apos is not None:
+        apos = (_valor_sql(apos[0]), int(apos[1]))
+        trechos = trechos[trechos.index(apos[0] is None):]
+    cols = ", ".join(dict.fromkeys(list(colunas) + ["id"]))
+    partes = []
+    with span(f"pagina_keyset:{tabela}") as reg, conexao() as conn:
+        for i, nulos in enumerate(trechos):
+            com_cursor = apos is not None and i == 0
+            if nulos:
+                cond, p = (f"{ordem} IS NULL AND id {op} ?", (apos[1],)) if com_cursor else (f"{ordem} IS NULL", ())
+                ordenacao = f"id {sentido}"
+            else:
+                cond, p = (f"({ordem}, id) {op} (?, ?)", apos) if com_cursor else (f"{ordem} IS NOT NULL", ())
+                ordenacao = f"{ordem} {sentido}, id {sentido}"
+            falta = limite + 1 - sum(len(d) for d in partes)
+            partes.append(pd.read_sql(f"SELECT {cols} FROM {tabela} WHERE ({where}) AND {cond} ORDER BY {ordenacao} LIMIT ?",
+                                      conn, params=tuple(params) + p + (falta,)))
+            if len(partes[-1]) == falta: break
+        reg["linhas"] = sum(len(d) for d in partes)
+    df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+    return df.iloc[:limite], len(df) > limite
+
+def totais_filtro(tabela, where="1", params=(), somas=()):
+    """(quantidade, soma de cada coluna de `somas`) das linhas do filtro, numa consulta agregada"""
+    with span(f"totais_filtro:{tabela}", cache="hit"):
+        return _totais_cached(tabela, versao_tabela(tabela), where, tuple(params), tuple(somas))
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _totais_cached(tabela, versao, where, params, somas):
+    marcar_miss()
+    expr = ", ".join(["COUNT(*)"] + [f"TOTAL({c})" for c in somas])
+    with conexao() as conn:
+        return conn.execute(f"SELECT {expr} FROM {tabela} WHERE {where}", params).fetchone()
+
+def agregar_resumo(df, resumo):
+    """Mesmo formato do resumo diário, calculado em pandas a partir de linhas brutas"""
+    dims = RESUMOS[resumo][1]
+    if df.empty:
+        return pd.DataFrame(columns=["Data"] + dims + ["Qtd", "Valor"])
+    base = pd.DataFrame({"Data": df["Data"].astype(str).str[:10]})
+    for d in dims:
+        base[d] = df[d].fillna("").astype(str) if d in df.columns else ""
+    base["Valor"] = pd.to_numeric(df["Valor"], errors="coerce").fillna(0.0)
+    return base.groupby(["Data"] + dims, as_index=False).agg(Qtd=("Valor", "size"), Valor=("Valor", "sum"))
+
+def termo_fts(termo):
+    """Converte o texto digitado numa consulta FTS5: todas as palavras, por prefixo"""
+    palavras = re.findall(r"\w+", str(termo or ""))
+    return " ".join(f'"{p}"*' for p in palavras) or None
+
+@cronometrado(linhas=lambda ids: len(ids or []))
+def buscar_ids(tabela, termo):
+    """ids da tabela que batem com o termo (índice FTS5); None se o termo for vazio"""
+    consulta = termo_fts(termo)
+    if consulta is None: return None
+    with conexao() as conn:
+        return [r[0] for r in conn.execute(f"SELECT rowid FROM busca_{tabela} WHERE busca_{tabela} MATCH ?", (consulta,))]
+
+def ler_classificacoes(chaves):
+    """{chave: (Categoria, Entidade)} das descrições já classificadas"""
+    chaves = list(chaves)
+    res = {}
+    with conexao() as conn:
+        for i in range(0, len(chaves), 500):
+            parte = chaves[i:i + 500]
+            marcas = ",".join("?" * len(parte))
+            for chave, cat, ent in conn.execute(f"SELECT Chave, Categoria, Entidade FROM classificacoes_ia WHERE Chave IN ({marcas})", parte):
+                res[chave] = (cat, ent)
+    return res
+
+def gravar_classificacoes(itens):
+    """itens: [(chave, descricao, categoria, entidade)]"""
+    if not itens: return
+    hoje = str(date.today())
+    with transacao() as conn:
+        conn.executemany("INSERT INTO classificacoes_ia (Chave, Descricao, Categoria, Entidade, Data) VALUES (?,?,?,?,?) "
+                         "ON CONFLICT(Chave) DO UPDATE SET Categoria=excluded.Categoria, Entidade=excluded.Entidade, Data=excluded.Data",
+                         [(k, d, c, e, hoje) for k, d, c, e in itens])
+
+def impressoes(datas, valores, descricoes, contas):
+    """Mesma expressão da coluna Impressao, calculada em pandas (linhas ainda fora do banco)"""
+    def texto(s): return s.fillna("").astype(str).str.strip(" ").str.translate(_MINUSCULAS_ASCII)
+    d = datas.astype(object).where(datas.notna(), "").astype(str).str[:10]
+    v = pd.to_numeric(valores, errors="coerce")
+    centavos = (np.sign(v) * np.floor(v.abs() * 100 + 0.5)).astype("Int64")
+    centavos = centavos.astype(str).where(centavos.notna(), "")
+    return d + "|" + centavos + "|" + texto(descricoes) + "|" + texto(contas)
+
+@cronometrado(linhas=len)
+def impressoes_existentes(tabela, chaves):
+    """Subconjunto das impressões que já estão na tabela (busca pelo índice)"""
+    chaves = list(chaves)
+    res = set()
+    with conexao() as conn:
+        for i in range(0, len(chaves), 500):
+            parte = chaves[i:i + 500]
+            marcas = ",".join("?" * len(parte))
+            res.update(r[0] for r in conn.execute(f"SELECT Impressao FROM {tabela} WHERE Impressao IN ({marcas})", parte))
+    return res
+
+# ==========================================
+# BACKUP (SNAPSHOTS)
+# ==========================================
+# Cópias consistentes feitas com a API de backup do SQLite, algumas páginas
+# por vez: entre um passo e outro os escritores seguem trabalhando.
+DIR_SNAPSHOTS = 'backups'
+MAX_SNAPSHOTS = 10
+PAGINAS_POR_PASSO = 256
+
+def listar_snapshots():
+    """Snapshots do banco, do mais novo para o mais antigo"""
+    if not os.path.isdir(DIR_SNAPSHOTS): return []
+    prefixo = os.path.splitext(DB_NAME)[0] + "_"
+    nomes = [n for n in os.listdir(DIR_SNAPSHOTS) if n.startswith(prefixo) and n.endswith((".db", ".db.gz"))]
+    return [os.path.join(DIR_SNAPSHOTS, n) for n in sorted(nomes, reverse=True)]
+
+@cronometrado()
+def criar_snapshot(comprimir=False):
+    """Grava um snapshot datado em DIR_SNAPSHOTS (gzip opcional) e apaga os excedentes"""
+    os.makedirs(DIR_SNAPSHOTS, exist_ok=True)
+    carimbo = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    destino = os.path.join(DIR_SNAPSHOTS, f"{os.path.splitext(DB_NAME)[0]}_{carimbo}.db")
+    temp = destino + ".tmp"
+    try:
+        with conexao() as origem, closing(sqlite3.connect(temp)) as copia:
+            # A transação de leitura fixa a versão do banco (WAL): escritas de outras
+            # conexões durante a cópia não reiniciam o backup nem entram no snapshot.
+            # Conexão reentrante já numa transação desta thread: usa a dela
+            propria = not origem.in_transaction
+            if propria: origem.execute("BEGIN")
+            origem.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            origem.backup(copia, pages=PAGINAS_POR_PASSO, sleep=0.005)
+            if propria: origem.rollback()
+            copia.execute("PRAGMA journal_mode=DELETE")  # arquivo único, sem -wal/-shm ao abrir
+        if comprimir:
+            with open(temp, "rb") as f_in, gzip.open(temp + ".gz", "wb", compresslevel=6) as f_out:
+                shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+            destino += ".gz"
+            os.replace(temp + ".gz", destino)
+        else:
+            os.replace(temp, destino)
+    finally:
+        for resto in (temp, temp + ".gz"):
+            if os.path.exists(resto): os.remove(resto)
+    for antigo in listar_snapshots()[MAX_SNAPSHOTS:]:
+        try: os.remove(antigo)
+        except FileNotFoundError: pass   # já removido por outra sessão
+    return destino
@@ -0,0 +1,9 @@
+"""Benchmarks dos caminhos de dados do CMG System, com dados sintéticos.
+
+Gera bancos de vendas/despesas/clientes de tamanhos fixos (semente fixa: os
+mesmos dados em toda execução) e extratos PDF/XLSX, mede as funções do app sem
+abrir o navegador e grava os tempos em JSON para comparar entre commits:
+
+    python -m benchmarks --linhas 10000 100000 --saida bench.json
+    python -m benchmarks --linhas 10000 --comparar bench.json
+"""
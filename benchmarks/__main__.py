@@ -0,0 +1,219 @@
+"""Executa os benchmarks: python -m benchmarks --help"""
+import argparse
+import ast
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Sem os avisos do modo "bare" (fora do `streamlit run`): o Streamlit refaz o nível dos
+# próprios loggers ao ler a configuração, por isso o corte é no logging inteiro
+logging.disable(logging.WARNING)
+
+import pandas as pd
+import streamlit as st
+
+import banco
+from benchmarks.dados import SEMENTE, popular_banco, extrato_pdf, extrato_xlsx
+from importacao import processar_arquivo_inteligente
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINHAS_PADRAO = (10_000, 100_000, 1_000_000)
+EXTRATOS_PADRAO = (500, 5_000)
+TEMA = (("#E53E3E", "#F6E05E", "#4FD1C5", "#9F7AEA"), "plotly_dark", "white", "#2D3748")
+COLS_FILTRO = ["Consultor", "Servico", "Status_Pagamento", "Conta_Recebimento"]
+BUSCA_FILTRO = ["Cliente", "CPF", "Empresa_Pagadora"]
+# Dependências pesadas que a partida do app não deveria carregar
+PESADOS = ("plotly.express", "plotly.graph_objects", "pdfplumber", "openai", "openpyxl")
+# Roda num interpretador novo: mede só o código recebido (os imports), sem o ast/json do script
+SCRIPT_PARTIDA = """import json, sys, time
+codigo = compile(sys.argv[1], "partida", "exec")
+inicio = time.perf_counter()
+exec(codigo, {})
+ms = (time.perf_counter() - inicio) * 1000
+print(json.dumps({"ms": ms, "pesados": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+def funcoes_app():
+    """Imports, constantes e funções de app.py, sem executar a página (login, menus...)"""
+    caminho = os.path.join(RAIZ, "app.py")
+    with open(caminho, encoding="utf-8") as f:
+        arvore = ast.parse(f.read())
+    def constante(no):
+        return isinstance(no, ast.Assign) and all(isinstance(t, ast.Name) and t.id.isupper() for t in no.targets)
+    nos = [no for no in arvore.body
+           if isinstance(no, (ast.Import, ast.ImportFrom, ast.FunctionDef)) or constante(no)]
+    ns = {"__name__": "app_benchmark"}
+    exec(compile(ast.Module(nos, type_ignores=[]), caminho, "exec"), ns)
+    return ns
+
+def medir(caso, linhas, fn, repeticoes, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar: preparar()
+        inicio = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - inicio)
+    res = {"caso": caso, "linhas": linhas, "mediana_s": round(statistics.median(tempos), 6),
+           "min_s": round(min(tempos), 6), "repeticoes": repeticoes}
+    print(f"{caso:<36} {linhas:>9}  {res['mediana_s'] * 1000:>10.1f} ms", flush=True)
+    return res
+
+def casos_banco(app, n, repeticoes):
+    """Mede os caminhos que dependem do banco com n vendas/despesas"""
+    res = []
+    qtds = {}
+    res.append(medir("popular_banco", n, lambda: qtds.update(popular_banco(n)), 1))
+    res[-1]["tabelas"] = qtds
+
+    res.append(medir("load_data (frio)", n, lambda: banco.load_data("vendas"), repeticoes,
+                     preparar=banco._load_data_cached.clear))
+    res.append(medir("load_data (cache)", n, lambda: banco.load_data("vendas"), repeticoes))
+
+    df_vendas = banco.load_data("vendas").copy()
+    def tratar_datas():
+        df = df_vendas.copy()
+        df['Data'] = pd.to_datetime(df['Data'], errors='coerce').dt.date
+        df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce').fillna(0.0)
+    res.append(medir("tratamento de datas (seção 8)", n, tratar_datas, repeticoes))
+
+    filtrar = lambda: app["renderizar_filtros_avancados"](df_vendas, COLS_FILTRO, BUSCA_FILTRO, key_prefix="bench", tabela="vendas")
+    def selecionar(**valores):
+        def preparar():
+            for col in COLS_FILTRO + ["search"]:
+                st.session_state[f"bench_{col}"] = valores.get(col, [] if col != "search" else "")
+        return preparar
+    res.append(medir("filtros (sem seleção)", n, filtrar, repeticoes, preparar=selecionar()))
+    res.append(medir("filtros (2 colunas)", n, filtrar, repeticoes,
+                     preparar=selecionar(Consultor=["Gu", "Ana"], Servico=["Consultoria"])))
+    res.append(medir("filtros (busca FTS)", n, filtrar, repeticoes, preparar=selecionar(search="Maria Silva")))
+
+    where, params = banco.filtro_sql("vendas", selecoes={"Consultor": ["Gu"]})
+    res.append(medir("pagina_keyset (1ª página)", n, lambda: banco.pagina_keyset("vendas", ["Data", "Cliente", "Valor"], "Data", True, None, 50, where, params), repeticoes))
+    res.append(medir("totais_filtro (frio)", n, lambda: banco.totais_filtro("vendas", where, params, ["Valor"]), repeticoes,
+                     preparar=banco._totais_cached.clear))
+
+    for tamanho in (50, 1000):
+        original = df_vendas.head(tamanho).copy()
+        def editar(original=original):
+            editado = original.copy()
+            editado["Valor"] = editado["Valor"] + 1
+            banco.update_full_table(editado, "vendas", original)
+            original["Valor"] = editado["Valor"]
+        res.append(medir(f"update_full_table ({tamanho} alteradas)", n, editar, repeticoes))
+
+    with tempfile.TemporaryDirectory() as pasta:
+        def exportar():
+            with banco.conexao() as conn:
+                app["converter_para_excel"](conn, app["ABAS_BACKUP"], os.path.join(pasta, "backup.xlsx"))
+        res.append(medir("converter_para_excel", n, exportar, 1))
+
+    # Dashboard: resumo diário, busca (agregar_resumo), mix e figuras
+    res.append(medir("dashboard: resumo diário (frio)", n, lambda: banco.load_data("resumo_vendas_diario"), repeticoes,
+                     preparar=banco._load_data_cached.clear))
+    df_r = banco.load_data("resumo_vendas_diario")
+    res.append(medir("dashboard: agregar_resumo", n, lambda: banco.agregar_resumo(df_vendas, "resumo_vendas_diario"), repeticoes))
+    res.append(medir("dashboard: mix de serviços", n, lambda: df_r.groupby("Servico", dropna=False, as_index=False)["Valor"].sum(), repeticoes))
+    res.append(medir("dashboard: reamostrar_serie", n, lambda: app["reamostrar_serie"](df_r["Data"], df_r["Valor"]), repeticoes))
+    figuras = lambda: app["figuras_dashboard"](("bench", n), df_r, df_r["Valor"].sum(), 0.0, 50000.0, TEMA)
+    res.append(medir("dashboard: figuras (frio)", n, figuras, repeticoes, preparar=app["figuras_dashboard"].clear))
+    res.append(medir("dashboard: figuras (cache)", n, figuras, repeticoes))
+    return res
+
+def casos_extratos(tamanhos, repeticoes):
+    res = []
+    for n in tamanhos:
+        for gerar in (extrato_xlsx, extrato_pdf):
+            arquivo = gerar(n)
+            ler = lambda: processar_arquivo_inteligente(arquivo)
+            res.append(medir(f"processar_arquivo ({arquivo.name.rsplit('.', 1)[1]})", n, ler, repeticoes,
+                             preparar=lambda: arquivo.seek(0)))
+    return res
+
+def imports_app():
+    """Os imports do topo de app.py, como texto"""
+    with open(os.path.join(RAIZ, "app.py"), encoding="utf-8") as f:
+        fonte = f.read()
+    return "\n".join(ast.get_source_segment(fonte, no) for no in ast.parse(fonte).body
+                     if isinstance(no, (ast.Import, ast.ImportFrom)))
+
+def casos_partida(repeticoes):
+    """Partida a frio: tempo dos imports num interpretador novo (o Streamlit sozinho e o app.py)"""
+    res = []
+    for caso, codigo in [("partida: import streamlit", "import streamlit"), ("partida: imports do app.py", imports_app())]:
+        tempos, pesados = [], []
+        for _ in range(repeticoes):
+            saida = subprocess.run([sys.executable, "-c", SCRIPT_PARTIDA, codigo, *PESADOS], cwd=RAIZ,
+                                   capture_output=True, text=True, check=True).stdout
+            medida = json.loads(saida.strip().splitlines()[-1])
+            tempos.append(medida["ms"] / 1000)
+            pesados = medida["pesados"]
+        res.append({"caso": caso, "linhas": 0, "mediana_s": round(statistics.median(tempos), 6),
+                    "min_s": round(min(tempos), 6), "repeticoes": repeticoes, "modulos_pesados": pesados})
+        print(f"{caso:<36} {0:>9}  {res[-1]['mediana_s'] * 1000:>10.1f} ms  pesados: {', '.join(pesados) or '-'}", flush=True)
+    return res
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def comparar(atual, caminho_anterior):
+    """Razão atual/anterior por (caso, linhas)"""
+    with open(caminho_anterior, encoding="utf-8") as f:
+        anterior = json.load(f)
+    base = {(r["caso"], r["linhas"]): r["mediana_s"] for r in anterior["resultados"]}
+    print(f"\nComparação com {anterior.get('commit')} ({caminho_anterior}):")
+    for r in atual["resultados"]:
+        antes = base.get((r["caso"], r["linhas"]))
+        if antes:
+            print(f"{r['caso']:<36} {r['linhas']:>9}  {antes * 1000:>10.1f} -> {r['mediana_s'] * 1000:>10.1f} ms  ({r['mediana_s'] / antes:.2f}x)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks com dados sintéticos")
+    parser.add_argument("--linhas", type=int, nargs="+", default=list(LINHAS_PADRAO), help="vendas/despesas por banco")
+    parser.add_argument("--extratos", type=int, nargs="*", default=list(EXTRATOS_PADRAO), help="lançamentos por extrato PDF/XLSX")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", help="arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    args = parser.parse_args(argv)
+
+    app = funcoes_app()
+    origem = os.getcwd()
+    resultados = []
+    try:
+        for n in args.linhas:
+            pasta = tempfile.mkdtemp(prefix=f"cmg_bench_{n}_")
+            os.chdir(pasta)
+            # Banco novo nesta pasta: o pool e o init_db guardados em cache apontam para o anterior
+            st.cache_resource.clear(); st.cache_data.clear()
+            try:
+                resultados += casos_banco(app, n, args.repeticoes)
+            finally:
+                os.chdir(origem)
+                st.cache_resource.clear()
+                shutil.rmtree(pasta, ignore_errors=True)
+        resultados += casos_extratos(args.extratos, args.repeticoes)
+        resultados += casos_partida(max(args.repeticoes, 5))
+    finally:
+        os.chdir(origem)
+
+    saida = {"commit": commit_atual(), "data": datetime.now().isoformat(timespec="seconds"), "semente": SEMENTE,
+             "python": sys.version.split()[0], "plataforma": platform.platform(), "resultados": resultados}
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(saida, f, ensure_ascii=False, indent=2)
+    if args.comparar:
+        comparar(saida, args.comparar)
+    return saida
+
+if __name__ == "__main__":
+    main()
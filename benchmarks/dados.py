@@ -0,0 +1,166 @@
+"""Gerador de dados sintéticos (semente fixa) para os benchmarks."""
+import io
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from banco import transacao, invalidar_tabelas
+
+SEMENTE = 42
+# Fim fixo (não date.today()): a mesma semente gera sempre as mesmas datas
+FIM_PERIODO = date(2025, 12, 31)
+ANOS_HISTORICO = 3
+
+CONSULTORES = ["Gu", "Kobe", "Ana", "Bia", "Caio"]
+SERVICOS = ["Limpeza de Nome", "Aumento de Score", "Consultoria", "Revisão de Contrato", "Rating"]
+STATUS = ["Pago Total", "Parcial", "Pendente"]
+BANCOS = ["Itaú", "Nubank", "Bradesco", "Caixa Principal"]
+CATEGORIAS = ["Fixa", "Comissões", "Marketing", "Impostos", "Fornecedores"]
+NOMES = ["José", "Maria", "João", "Ana", "Daniel", "Luíza", "Pedro", "Carla", "Márcio", "Sônia", "Rafael", "Beatriz"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Lima", "Gonçalves", "Araújo", "Ribeiro", "Conceição"]
+HISTORICOS = ["PIX RECEBIDO", "PIX ENVIADO", "TED", "PAGTO BOLETO", "TARIFA PACOTE", "DEB AUTOMATICO", "COMPRA CARTAO"]
+
+def _datas(rng, n):
+    dias = rng.integers(0, 365 * ANOS_HISTORICO, n)
+    return (pd.Timestamp(FIM_PERIODO) - pd.to_timedelta(dias, unit="D")).strftime("%Y-%m-%d").to_numpy()
+
+def _escolher(rng, opcoes, n):
+    return np.asarray(opcoes, dtype=object)[rng.integers(0, len(opcoes), n)]
+
+def _nomes(rng, n):
+    return _escolher(rng, NOMES, n) + " " + _escolher(rng, SOBRENOMES, n) + " " + _escolher(rng, SOBRENOMES, n)
+
+def _valores(rng, n, media):
+    # Distribuição assimétrica, como os valores reais (muitos pequenos, poucos grandes)
+    return np.round(rng.lognormal(np.log(media), 0.6, n), 2)
+
+def gerar_clientes(n, semente=SEMENTE):
+    rng = np.random.default_rng(semente)
+    nomes = _nomes(rng, n)
+    return pd.DataFrame({
+        "Nome": nomes + " " + np.arange(n).astype(str),   # nome + número: chaves distintas mesmo sem CPF
+        "CPF": [f"{i:011d}" for i in rng.permutation(n) + 10_000_000_000 // 2],
+        "Email": [f"cliente{i}@exemplo.com" for i in range(n)],
+        "Telefone": [f"(11) 9{i % 100_000_000:08d}" for i in range(n)],
+        "Data_Cadastro": _datas(rng, n),
+        "Obs": _escolher(rng, ["", "Indicação", "Auto Venda", "Importado"], n),
+    })
+
+def gerar_vendas(n, clientes=None, semente=SEMENTE):
+    rng = np.random.default_rng(semente + 1)
+    clientes = gerar_clientes(max(n // 4, 1), semente) if clientes is None else clientes
+    idx = rng.integers(0, len(clientes), n)
+    return pd.DataFrame({
+        "Data": _datas(rng, n),
+        "Consultor": _escolher(rng, CONSULTORES, n),
+        "Cliente": clientes["Nome"].to_numpy()[idx],
+        "CPF": clientes["CPF"].to_numpy()[idx],
+        "Email": clientes["Email"].to_numpy()[idx],
+        "Telefone": clientes["Telefone"].to_numpy()[idx],
+        "Servico": _escolher(rng, SERVICOS, n),
+        "Valor": _valores(rng, n, 600),
+        "Status_Pagamento": _escolher(rng, STATUS, n),
+        "Conta_Recebimento": _escolher(rng, BANCOS, n),
+        "Obs": _escolher(rng, ["", "PIX", "Boleto", "Cartão 3x"], n),
+        "Docs": "0 arqs",
+        "Empresa_Pagadora": clientes["Nome"].to_numpy()[idx],
+    })
+
+def gerar_despesas(n, semente=SEMENTE):
+    rng = np.random.default_rng(semente + 2)
+    return pd.DataFrame({
+        "Data": _datas(rng, n),
+        "Categoria": _escolher(rng, CATEGORIAS, n),
+        "Descricao": _escolher(rng, HISTORICOS, n) + " " + rng.integers(1000, 9999, n).astype(str),
+        "Conta_Origem": _escolher(rng, BANCOS, n),
+        "Valor": _valores(rng, n, 250),
+        "Fornecedor": _nomes(rng, n),
+    })
+
+def popular_banco(n, semente=SEMENTE):
+    """Grava n vendas, n despesas e n/4 clientes no banco atual (banco.DB_NAME)"""
+    clientes = gerar_clientes(max(n // 4, 1), semente)
+    tabelas = {"clientes": clientes, "vendas": gerar_vendas(n, clientes, semente), "despesas": gerar_despesas(n, semente)}
+    with transacao() as conn:
+        for tabela, df in tabelas.items():
+            cols = ", ".join(df.columns)
+            marcas = ", ".join("?" * len(df.columns))
+            conn.executemany(f"INSERT INTO {tabela} ({cols}) VALUES ({marcas})", df.itertuples(index=False, name=None))
+        invalidar_tabelas(conn, *tabelas)
+    return {t: len(df) for t, df in tabelas.items()}
+
+# --- EXTRATOS BANCÁRIOS ---
+def gerar_extrato(n, semente=SEMENTE):
+    """Linhas de extrato no formato dos bancos (data dd/mm/aaaa, histórico, valor com vírgula)"""
+    rng = np.random.default_rng(semente + 3)
+    valores = _valores(rng, n, 300) * np.where(rng.random(n) < 0.6, -1, 1)
+    return pd.DataFrame({
+        "Data": pd.to_datetime(_datas(rng, n)).strftime("%d/%m/%Y"),
+        "Histórico": _escolher(rng, HISTORICOS, n) + " " + _nomes(rng, n),
+        "Valor": [f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") for v in valores],
+    })
+
+class ArquivoSintetico(io.BytesIO):
+    # Mesmo formato do UploadedFile do Streamlit: bytes + .name
+    def __init__(self, dados, nome):
+        super().__init__(dados)
+        self.name = nome
+
+def extrato_xlsx(n, semente=SEMENTE):
+    buffer = io.BytesIO()
+    gerar_extrato(n, semente).to_excel(buffer, index=False)
+    return ArquivoSintetico(buffer.getvalue(), f"extrato_{n}.xlsx")
+
+LINHAS_POR_PAGINA = 40
+COLUNAS_PDF = [(40, 110), (110, 470), (470, 560)]   # (x inicial, x final) de Data, Histórico, Valor
+
+def _texto_pdf(s):
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _pagina_pdf(linhas):
+    """Conteúdo de uma página: tabela com grade (o extract_table do pdfplumber acha pelas linhas)"""
+    altura, topo = 16, 780
+    base = topo - altura * len(linhas)
+    cmds = ["0.5 w"]
+    for i in range(len(linhas) + 1):
+        cmds.append(f"{COLUNAS_PDF[0][0]} {topo - i * altura} m {COLUNAS_PDF[-1][1]} {topo - i * altura} l S")
+    for x in [c[0] for c in COLUNAS_PDF] + [COLUNAS_PDF[-1][1]]:
+        cmds.append(f"{x} {topo} m {x} {base} l S")
+    cmds.append("BT /F1 8 Tf")
+    for i, linha in enumerate(linhas):
+        for (x, _), celula in zip(COLUNAS_PDF, linha):
+            cmds.append(f"1 0 0 1 {x + 3} {topo - (i + 1) * altura + 5} Tm ({_texto_pdf(str(celula))}) Tj")
+    cmds.append("ET")
+    return "\n".join(cmds).encode("cp1252")
+
+def extrato_pdf(n, semente=SEMENTE):
+    """PDF de extrato com n lançamentos (cabeçalho repetido em cada página), escrito à mão: sem dependências"""
+    df = gerar_extrato(n, semente)
+    linhas = df.values.tolist()
+    paginas = [[list(df.columns)] + linhas[i:i + LINHAS_POR_PAGINA] for i in range(0, len(linhas), LINHAS_POR_PAGINA)]
+    # Objetos: 1 catálogo, 2 páginas, 3 fonte; depois (página, conteúdo) para cada página
+    objetos = {3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"}
+    kids = []
+    for i, pagina in enumerate(paginas):
+        num_pag, num_cont = 4 + 2 * i, 5 + 2 * i
+        conteudo = _pagina_pdf(pagina)
+        objetos[num_pag] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {num_cont} 0 R >>").encode()
+        objetos[num_cont] = b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream"
+        kids.append(f"{num_pag} 0 R")
+    objetos[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objetos[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    saida = io.BytesIO()
+    saida.write(b"%PDF-1.4\n")
+    posicoes = {}
+    for num in sorted(objetos):
+        posicoes[num] = saida.tell()
+        saida.write(b"%d 0 obj\n" % num + objetos[num] + b"\nendobj\n")
+    inicio_xref = saida.tell()
+    saida.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1))
+    for num in sorted(objetos):
+        saida.write(b"%010d 00000 n \n" % posicoes[num])
+    saida.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref))
+    return ArquivoSintetico(saida.getvalue(), f"extrato_{n}.pdf")
@@ -0,0 +1,222 @@
+"""Classificação dos lançamentos importados (Categoria / Entidade).
+
+Primeiro um modelo local (vizinho mais próximo por n-gramas), treinado nos
+lançamentos já confirmados; o que ele não resolve com confiança vai para a
+IA. As descrições já vistas pela IA saem da tabela classificacoes_ia
+(banco.py); só as novas vão para a API da OpenAI, em lotes enviados em
+paralelo. Para testar contra um servidor local compatível, passe base_url
+(ou defina OPENAI_BASE_URL).
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from banco import conexao, versao_tabela, ler_classificacoes, gravar_classificacoes
+
+MODELO_IA = "gpt-3.5-turbo"
+TAMANHO_LOTE_IA = 40
+MAX_CONCORRENCIA_IA = 4
+MAX_TENTATIVAS_IA = 6   # o cliente da OpenAI repete 429/5xx com backoff exponencial (respeita Retry-After)
+
+RE_RESPOSTA = re.compile(r'^\s*-?\s*(\d+)\s*[.)]?\s*->\s*(.*?)\s*\|\s*(.*?)\s*$')
+
+def chave_descricao(desc):
+    """Chave do memo: sem espaços repetidos e sem diferença de maiúsculas"""
+    return " ".join(str(desc).split()).casefold()
+
+# --- MODELO LOCAL ---
+# Tabela -> (coluna de texto, rótulo que vira Categoria, rótulo que vira Entidade)
+FONTES_MODELO = {
+    "despesas": ("Descricao", "Categoria", "Fornecedor"),
+    "vendas": ("Obs", "Servico", "Cliente"),
+}
+VIZINHOS_MODELO = 5
+LIMIAR_CONFIANCA = 0.6    # abaixo disso a linha vai para a IA
+LIMIAR_ENTIDADE = 0.85    # a entidade só é copiada de um vizinho quase idêntico
+FRACAO_GRAMA_COMUM = 0.2  # n-gramas presentes em mais docs que isso não discriminam (e custam caro)
+
+RE_NUMEROS = re.compile(r'\d+')
+ROTULOS_VAZIOS = {"", "geral", "nan", "none"}   # "Geral": categoria da importação sem classificação
+
+def _rotulo(valor):
+    """Rótulo sem espaços nas pontas; "" quando vazio ou só um marcador ("Geral", "nan")"""
+    valor = str(valor or "").strip()
+    return "" if valor.casefold() in ROTULOS_VAZIOS else valor
+
+def normalizar_texto(texto):
+    """Sem acentos, minúsculo, números colapsados (datas e códigos variam entre lançamentos)"""
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode().casefold()
+    return " ".join(RE_NUMEROS.sub("0", texto).split())
+
+def _ngramas(texto):
+    t = f" {texto} "
+    return {t[i:i + 3] for i in range(len(t) - 2)} | {f"#{p}" for p in texto.split() if len(p) > 1}
+
+class ModeloLocal:
+    """Vizinho mais próximo (cosseno sobre n-gramas de caracteres) nos lançamentos confirmados de uma tabela"""
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.colunas = FONTES_MODELO[tabela]
+        self._lock = threading.Lock()
+        self._limpar()
+
+    def _limpar(self):
+        self.versao = None
+        self.ultimo_id = 0
+        self.docs = {}                     # texto normalizado -> nº do doc
+        self.rotulos = []                  # por doc: Counter de (categoria, entidade)
+        self.normas = []                   # por doc: raiz do nº de n-gramas
+        self.indice = defaultdict(list)    # n-grama -> docs
+        self._congelado = None             # índice em arrays numpy (refeito após acrescentar)
+
+    def _ler(self, desde_id):
+        texto, cat, ent = self.colunas
+        with conexao() as conn:
+            return conn.execute(f"SELECT id, {texto}, {cat}, {ent} FROM {self.tabela} WHERE id > ? ORDER BY id", (desde_id,)).fetchall()
+
+    def _acrescentar(self, linhas):
+        for id_, texto, cat, ent in linhas:
+            self.ultimo_id = max(self.ultimo_id, id_)
+            chave = normalizar_texto(texto or "")
+            cat, ent = _rotulo(cat), _rotulo(ent)
+            if not chave or not cat: continue
+            doc = self.docs.get(chave)
+            if doc is None:
+                doc = self.docs[chave] = len(self.rotulos)
+                gramas = _ngramas(chave)
+                self.rotulos.append(Counter())
+                self.normas.append(math.sqrt(len(gramas)))
+                for g in gramas: self.indice[g].append(doc)
+            self.rotulos[doc][(cat, ent)] += 1
+        self._congelado = None
+
+    def _congelar(self):
+        if self._congelado is None:
+            limite = max(50, FRACAO_GRAMA_COMUM * len(self.rotulos))
+            self._congelado = ({g: np.array(d, dtype=np.int32) for g, d in self.indice.items() if len(d) <= limite},
+                               np.array(self.normas))
+        return self._congelado
+
+    def sincronizar(self):
+        """Reconstrói o índice se a tabela mudou desde o último uso"""
+        with self._lock:
+            versao = versao_tabela(self.tabela)
+            if versao != self.versao:
+                self._limpar()
+                self._acrescentar(self._ler(0))
+                self.versao = versao
+
+    def acrescentar_importados(self):
+        """Depois de uma importação: indexa só as linhas novas"""
+        with self._lock:
+            versao = versao_tabela(self.tabela)
+            # A importação sobe a versão em exatamente 1; qualquer outra edição no meio pede reconstrução
+            if self.versao is not None and versao == self.versao + 1:
+                self._acrescentar(self._ler(self.ultimo_id))
+                self.versao = versao
+
+    def _vizinhos(self, chave):
+        doc = self.docs.get(chave)
+        if doc is not None: return [(1.0, doc)]
+        indice, normas = self._congelar()
+        gramas = _ngramas(chave)
+        partes = [indice[g] for g in gramas if g in indice]
+        if not partes: return []
+        # Cosseno entre conjuntos de n-gramas: comuns / (raiz(|q|) * raiz(|d|))
+        docs, comuns = np.unique(np.concatenate(partes), return_counts=True)
+        sims = comuns / (math.sqrt(len(gramas)) * normas[docs])
+        topo = np.argpartition(-sims, VIZINHOS_MODELO)[:VIZINHOS_MODELO] if len(sims) > VIZINHOS_MODELO else range(len(sims))
+        return sorted(((float(sims[i]), int(docs[i])) for i in topo), reverse=True)
+
+    def prever(self, descricoes):
+        """{descricao: (categoria, entidade, confiança)}; entidade vazia quando incerta"""
+        self.sincronizar()
+        res = {}
+        with self._lock:
+            for desc in descricoes:
+                vizinhos = self._vizinhos(normalizar_texto(desc))
+                if not vizinhos: continue
+                votos = Counter()
+                for sim, d in vizinhos:
+                    total = sum(self.rotulos[d].values())
+                    for (cat, _), n in self.rotulos[d].items(): votos[cat] += sim * n / total
+                cat, peso = votos.most_common(1)[0]
+                sim_topo, d_topo = vizinhos[0]
+                entidades = Counter({ent: n for (c, ent), n in self.rotulos[d_topo].items() if c == cat and ent})
+                ent = entidades.most_common(1)[0][0] if entidades and sim_topo >= LIMIAR_ENTIDADE else ""
+                res[desc] = (cat, ent, sim_topo * peso / sum(votos.values()))
+        return res
+
+# --- IA ---
+def _prompt(descricoes):
+    lista = "\n".join(f"{i}. {d}" for i, d in enumerate(descricoes, start=1))
+    return f"""
+        Analise estas descrições bancárias. Identifique:
+        1. Categoria (Ex: Alimentação, Transporte, Marketing, Fixo, Venda, Serviços).
+        2. Entidade (Nome da Loja, Pessoa ou Cliente).
+        Retorne uma linha por item, no formato exato: Número -> Categoria | Entidade
+        Itens:
+        {lista}
+        """
+
+def _interpretar(texto, descricoes):
+    res = {}
+    for linha in texto.split("\n"):
+        m = RE_RESPOSTA.match(linha)
+        if m and 1 <= int(m.group(1)) <= len(descricoes):
+            res[descricoes[int(m.group(1)) - 1]] = (m.group(2), m.group(3))
+        elif "->" in linha and "|" in linha:
+            # Formato antigo: Descrição -> Categoria | Entidade
+            pt1, pt2 = linha.split("->", 1)
+            cat, ent = pt2.split("|", 1)
+            res[pt1.strip("- ").strip()] = (cat.strip(), ent.strip())
+    return res
+
+def _classificar_lote(client, descricoes):
+    resp = client.chat.completions.create(model=MODELO_IA, messages=[{"role": "user", "content": _prompt(descricoes)}], temperature=0)
+    return _interpretar(resp.choices[0].message.content, descricoes)
+
+def classificar_descricoes(descricoes, api_key, base_url=None):
+    """{descricao: (categoria, entidade)} + lista de erros dos lotes que falharam"""
+    por_chave = {}
+    for d in descricoes:
+        por_chave.setdefault(chave_descricao(d), d)
+    memo = ler_classificacoes(por_chave)
+    res = {d: memo[k] for k, d in por_chave.items() if k in memo}
+    novas = [d for k, d in por_chave.items() if k not in memo]
+    if not novas or not api_key:
+        return res, []
+
+    from openai import OpenAI   # só quando há o que mandar para a API (import pesado)
+    client = OpenAI(api_key=api_key, base_url=base_url, max_retries=MAX_TENTATIVAS_IA)
+    lotes = [novas[i:i + TAMANHO_LOTE_IA] for i in range(0, len(novas), TAMANHO_LOTE_IA)]
+    erros = []
+    with ThreadPoolExecutor(max_workers=MAX_CONCORRENCIA_IA) as ex:
+        futuros = [ex.submit(_classificar_lote, client, lote) for lote in lotes]
+        for futuro in futuros:
+            try: res.update(futuro.result())
+            except Exception as e: erros.append(str(e))
+    gravar_classificacoes([(chave_descricao(d), d, cat, ent) for d, (cat, ent) in res.items() if chave_descricao(d) not in memo])
+    return res, erros
+
+def classificar_lote_com_ia(df, api_key, base_url=None, modelo=None):
+    """Preenche Categoria/Entidade da prévia (modelo local antes da IA). Retorna (df, erros)"""
+    mask = (df["Entidade"] == "") | (df["Entidade"] == df["Descrição"])
+    descricoes = df["Descrição"].dropna().unique().tolist()
+    sem_entidade = set(df.loc[mask, "Descrição"])
+    # Só vai para a IA o que o modelo local não resolve com confiança (categoria e, se faltar, entidade)
+    locais = {d: (cat, ent) for d, (cat, ent, conf) in (modelo.prever(descricoes) if modelo else {}).items()
+              if conf >= LIMIAR_CONFIANCA and (ent or d not in sem_entidade)}
+    mapa, erros = classificar_descricoes([d for d in descricoes if d not in locais], api_key, base_url)
+    mapa.update(locais)
+    if not mapa: return df, erros
+    por_chave = {chave_descricao(d): v for d, v in mapa.items()}
+    chaves = df["Descrição"].map(chave_descricao)
+    df["Categoria"] = chaves.map({k: v[0] for k, v in por_chave.items()}).fillna(df["Categoria"])
+    df.loc[mask, "Entidade"] = chaves[mask].map({k: v[1] for k, v in por_chave.items() if v[1]}).fillna(df.loc[mask, "Entidade"])
+    return df, erros
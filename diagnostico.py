@@ -0,0 +1,148 @@
+"""Diagnóstico de desempenho: spans cronometrados por rerun, gravados num JSONL rotativo.
+
+Sem dependência do Streamlit. O app abre a coleta no começo de cada rerun
+(iniciar_rerun), marca as seções numeradas do app.py com secao() e mede trechos
+e funções com span()/cronometrado. Cada registro traz o tempo (ms) e, quando
+houver, as linhas tocadas e o acerto do cache. Um rerun interrompido por
+st.rerun/st.stop é gravado no começo do rerun seguinte da mesma sessão.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+DIR_DIAGNOSTICO = os.path.join('.cache', 'diagnostico')
+ARQUIVO_LOG = os.path.join(DIR_DIAGNOSTICO, 'spans.jsonl')
+MAX_BYTES_LOG = 5 * 1024 * 1024
+MAX_ARQUIVOS_LOG = 3   # spans.jsonl, spans.jsonl.1 e spans.jsonl.2
+
+_estado = threading.local()        # rerun da thread atual
+_abertos = {}                      # sessão -> rerun ainda não gravado
+_lock = threading.Lock()
+
+def _rerun():
+    return getattr(_estado, "rerun", None)
+
+def iniciar_rerun(sessao, **contexto):
+    """Começa a coleta do rerun da sessão (grava antes o rerun anterior dela, se ficou pendente)"""
+    with _lock:
+        anterior = _abertos.pop(sessao, None)
+    if anterior: _gravar(anterior, interrompido=True)
+    r = {"sessao": sessao, "id": f"{time.time_ns():x}", "inicio": datetime.now().isoformat(timespec="milliseconds"),
+         "contexto": dict(contexto), "registros": [], "pilha": [], "secao": None, "ultimo": time.perf_counter()}
+    with _lock:
+        _abertos[sessao] = r
+    _estado.rerun = r
+
+def finalizar_rerun():
+    """Fecha a seção aberta e grava os registros do rerun"""
+    r = _rerun()
+    if r is None: return
+    _estado.rerun = None
+    with _lock:
+        if _abertos.get(r["sessao"]) is r: del _abertos[r["sessao"]]
+    _gravar(r)
+
+def anotar(**contexto):
+    """Acrescenta campos (página, usuário...) a todos os registros do rerun"""
+    r = _rerun()
+    if r: r["contexto"].update(contexto)
+
+def _abrir(r, nome, tipo, info):
+    nivel = (len(r["pilha"]) + (r["secao"] is not None)) if r and tipo == "span" else 0
+    return {"span": nome, "tipo": tipo, "nivel": nivel, **info, "_t0": time.perf_counter()}
+
+def _fechar(r, reg, fim=None):
+    fim = fim or time.perf_counter()
+    reg["ms"] = round((fim - reg.pop("_t0")) * 1000, 3)
+    if r:
+        r["registros"].append(reg)
+        r["ultimo"] = fim
+
+@contextmanager
+def span(nome, **info):
+    """Mede o bloco. Dentro dele, o registro (dict) pode receber linhas=... e cache=..."""
+    r = _rerun()
+    reg = _abrir(r, nome, "span", info)
+    if r: r["pilha"].append(reg)
+    try:
+        yield reg
+    finally:
+        if r: r["pilha"] = [p for p in r["pilha"] if p is not reg]
+        _fechar(r, reg)
+
+def cronometrado(nome=None, linhas=None, cache=False):
+    """Decorador: mede cada chamada. linhas(resultado) conta as linhas tocadas;
+    cache=True registra "hit", trocado por "miss" quando a função em cache roda (marcar_miss)"""
+    def decorador(fn):
+        rotulo = nome or fn.__name__
+        @functools.wraps(fn)
+        def medida(*args, **kwargs):
+            with span(rotulo, **({"cache": "hit"} if cache else {})) as reg:
+                resultado = fn(*args, **kwargs)
+                if linhas: reg["linhas"] = linhas(resultado)
+                return resultado
+        return medida
+    return decorador
+
+def marcar_miss():
+    """Chamada no corpo de uma função em cache (só roda quando o cache falha)"""
+    r = _rerun()
+    for reg in reversed(r["pilha"] if r else []):
+        if "cache" in reg:
+            reg["cache"] = "miss"
+            return
+
+def secao(nome):
+    """Fecha a seção atual e abre `nome` (seções numeradas do app.py, sem reindentar o código)"""
+    r = _rerun()
+    if r is None: return
+    if r["secao"]: _fechar(r, r["secao"])
+    r["secao"] = _abrir(r, nome, "secao", {})
+
+def _gravar(r, interrompido=False):
+    # Interrompido: a seção aberta termina no último evento medido, não agora
+    if r["secao"]: _fechar(r, r["secao"], r["ultimo"] if interrompido else None)
+    base = {"rerun": r["id"], "ts": r["inicio"], **r["contexto"]}
+    gravar_log([json.dumps({**base, **reg}, ensure_ascii=False, default=str) for reg in r["registros"]])
+
+def gravar_log(linhas):
+    """Acrescenta linhas ao JSONL; passando de MAX_BYTES_LOG, roda os arquivos (o mais antigo sai)"""
+    if not linhas: return
+    with _lock:
+        os.makedirs(DIR_DIAGNOSTICO, exist_ok=True)
+        if os.path.exists(ARQUIVO_LOG) and os.path.getsize(ARQUIVO_LOG) > MAX_BYTES_LOG:
+            for i in range(MAX_ARQUIVOS_LOG - 1, 0, -1):
+                origem = ARQUIVO_LOG if i == 1 else f"{ARQUIVO_LOG}.{i - 1}"
+                if os.path.exists(origem): os.replace(origem, f"{ARQUIVO_LOG}.{i}")
+        with open(ARQUIVO_LOG, "a", encoding="utf-8") as f:
+            f.write("\n".join(linhas) + "\n")
+
+def ler_registros():
+    """Registros de todos os arquivos do log, do mais antigo ao mais novo"""
+    registros = []
+    for i in range(MAX_ARQUIVOS_LOG - 1, -1, -1):
+        caminho = f"{ARQUIVO_LOG}.{i}" if i else ARQUIVO_LOG
+        if not os.path.exists(caminho): continue
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                try: registros.append(json.loads(linha))
+                except ValueError: pass   # linha cortada (gravação interrompida)
+    return registros
+
+def resumo_spans(df):
+    """Por span: chamadas, p50/p95/máximo (ms), média de linhas e taxa de acerto do cache"""
+    g = df.groupby("span")
+    res = pd.DataFrame({"chamadas": g.size(), "p50_ms": g["ms"].median(), "p95_ms": g["ms"].quantile(0.95),
+                        "max_ms": g["ms"].max(), "total_ms": g["ms"].sum()})
+    if "linhas" in df.columns:
+        res["linhas_media"] = g["linhas"].mean()
+    if "cache" in df.columns:
+        cache = df.assign(_hit=df["cache"].eq("hit"), _medido=df["cache"].notna()).groupby("span")[["_hit", "_medido"]].sum()
+        res["acerto_cache"] = cache["_hit"] / cache["_medido"].where(cache["_medido"] > 0)
+    return res.sort_values("p95_ms", ascending=False).reset_index()
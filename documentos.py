@@ -0,0 +1,108 @@
+"""Documentos anexados às vendas/clientes (armazenamento endereçado por conteúdo).
+
+Cada upload é gravado em blocos num blob com o nome do seu SHA-256: o mesmo
+PDF enviado várias vezes ocupa o disco uma vez só. A tabela documentos
+(banco.py) liga o blob à venda e ao cliente, com nome, tamanho e tipo.
+"""
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date
+
+from banco import conexao
+
+DIR_DOCUMENTOS = 'documentos_clientes'
+DIR_BLOBS = os.path.join(DIR_DOCUMENTOS, '_blobs')
+TAMANHO_BLOCO = 1024 * 1024
+
+def caminho_blob(hash_doc):
+    # Subpastas pelos 2 primeiros caracteres: nenhuma pasta fica com milhares de arquivos
+    return os.path.join(DIR_BLOBS, hash_doc[:2], hash_doc)
+
+def gravar_blob(arquivo):
+    """Copia o arquivo em blocos, calculando o SHA-256 no caminho. Retorna (hash, tamanho)"""
+    os.makedirs(DIR_BLOBS, exist_ok=True)
+    sha, tamanho = hashlib.sha256(), 0
+    fd, temp = tempfile.mkstemp(dir=DIR_BLOBS)
+    try:
+        with os.fdopen(fd, "wb") as destino:
+            arquivo.seek(0)
+            while True:
+                bloco = arquivo.read(TAMANHO_BLOCO)
+                if not bloco: break
+                sha.update(bloco)
+                destino.write(bloco)
+                tamanho += len(bloco)
+        hash_doc = sha.hexdigest()
+        caminho = caminho_blob(hash_doc)
+        if not os.path.exists(caminho):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            os.replace(temp, caminho)
+    finally:
+        if os.path.exists(temp): os.remove(temp)
+    return hash_doc, tamanho
+
+def tipo_mime(nome, declarado=None):
+    return declarado or mimetypes.guess_type(nome)[0] or "application/octet-stream"
+
+def gravar_uploads(arquivos):
+    """Grava os blobs dos uploads, fora de qualquer transação. Retorna [(hash, tamanho, nome, mime)]"""
+    blobs = []
+    for arq in arquivos or []:
+        hash_doc, tamanho = gravar_blob(arq)
+        blobs.append((hash_doc, tamanho, arq.name, tipo_mime(arq.name, getattr(arq, "type", None))))
+    return blobs
+
+def salvar_documentos(conn, blobs, venda_id=None, cliente_id=None):
+    """Registra na transação de conn os blobs já gravados por gravar_uploads. Retorna a quantidade"""
+    hoje = str(date.today())
+    conn.executemany("INSERT INTO documentos (Hash, Tamanho, Nome, Mime, Venda_id, Cliente_id, Data) VALUES (?,?,?,?,?,?,?)",
+                     [(*blob, venda_id, cliente_id, hoje) for blob in blobs])
+    return len(blobs)
+
+def clientes_com_documentos():
+    """[(id, Nome, qtd de documentos)]"""
+    with conexao() as conn:
+        return conn.execute("""SELECT c.id, c.Nome, COUNT(*) FROM documentos d JOIN clientes c ON c.id = d.Cliente_id
+                               GROUP BY c.id ORDER BY c.Nome""").fetchall()
+
+def documentos_do_cliente(cliente_id, limite=-1, inicio=0):
+    """Metadados dos documentos do cliente (consulta pelo índice de Cliente_id), página opcional"""
+    with conexao() as conn:
+        return conn.execute("SELECT id, Nome, Tamanho, Mime, Hash, Venda_id, Data FROM documentos "
+                            "WHERE Cliente_id = ? ORDER BY id DESC LIMIT ? OFFSET ?", (cliente_id, limite, inicio)).fetchall()
+
+def ler_documento(hash_doc):
+    return ler_arquivo(caminho_blob(hash_doc))
+
+def ler_arquivo(caminho):
+    with open(caminho, "rb") as f: return f.read()
+
+def listar_pasta(caminho):
+    """[(nome, tamanho, mtime, mime)] dos arquivos da pasta, só pelo stat (nenhum é aberto)"""
+    with os.scandir(caminho) as entradas:
+        return sorted((e.name, info.st_size, info.st_mtime, tipo_mime(e.name))
+                      for e in entradas if e.is_file() for info in [e.stat()])
+
+def zip_arquivos(itens):
+    """Bytes do zip de [(nome no zip, caminho)]. Montado num arquivo temporário, copiando em blocos;
+    retorna bytes porque o download_button não aceita o arquivo temporário (BufferedRandom)"""
+    with tempfile.TemporaryFile() as saida:
+        _escrever_zip(saida, itens)
+        saida.seek(0)
+        return saida.read()
+
+def _escrever_zip(saida, itens):
+    usados = set()
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nome, caminho in itens:
+            base, ext = os.path.splitext(nome)
+            n = 2
+            while nome in usados:
+                nome, n = f"{base} ({n}){ext}", n + 1
+            usados.add(nome)
+            with open(caminho, "rb") as origem, zf.open(nome, "w") as destino:
+                shutil.copyfileobj(origem, destino, TAMANHO_BLOCO)
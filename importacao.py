@@ -0,0 +1,297 @@
+"""Leitura e normalização de arquivos importados (extratos PDF/Excel e planilhas de clientes).
+
+Sem dependência do Streamlit: as funções rodam também nos processos do
+pool de importação (ver processar_lote).
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+# --- Valores e datas: coluna inteira de uma vez (tests/test_importacao.py compara com a versão linha a linha) ---
+RE_DATA_BR = r'(\d{2}/\d{2}/\d{2,4})'
+
+def clean_currency_serie(serie):
+    if pd.api.types.is_numeric_dtype(serie):
+        return pd.to_numeric(serie, errors="coerce").fillna(0.0).astype(float)
+    vazio = serie.isna().to_numpy()
+    texto = serie.astype(object).where(~vazio, "").astype(str)
+    negativo = texto.str.contains(r'[-(dD]', regex=True).to_numpy()
+    limpo = texto.str.replace(r'[^\d.,]', '', regex=True)
+    milhar = limpo.str.contains(",", regex=False) & limpo.str.contains(".", regex=False)
+    if milhar.any():
+        limpo = limpo.where(~milhar, limpo.str.replace(".", "", regex=False))
+    valores = pd.to_numeric(limpo.str.replace(",", ".", regex=False), errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    valores = np.where(negativo, -valores, valores)
+    # Números que já vieram como int/float (ex.: Excel, coluna mista) não passam pelo tratamento de texto
+    if serie.dtype == object:
+        numerico = np.fromiter((isinstance(v, (int, float)) for v in serie.to_numpy()), dtype=bool, count=len(serie)) & ~vazio
+        if numerico.any():
+            valores[numerico] = pd.to_numeric(serie[numerico]).to_numpy(dtype=float)
+    valores[vazio] = 0.0
+    return pd.Series(valores, index=serie.index)
+
+def parse_pdf_data_serie(serie):
+    hoje = str(date.today())
+    achado = serie.astype(object).where(serie.notna(), "").astype(str).str.extract(RE_DATA_BR, expand=False)
+    datas = pd.to_datetime(achado, format="%d/%m/%Y", errors="coerce")
+    datas = datas.fillna(pd.to_datetime(achado, format="%d/%m/%y", errors="coerce"))
+    return datas.dt.strftime("%Y-%m-%d").fillna(hoje)
+
+def mapear_colunas(df):
+    """Posições (no df original) das colunas de Data, Valor, Descrição, Entidade, Categoria e Conta"""
+    posicoes = [i for i in range(df.shape[1]) if df.iloc[:, i].notna().any()]  # ignora colunas vazias
+    cols_lower = [str(df.columns[i]).replace("\n", " ").strip().lower() for i in posicoes]
+
+    def get_idx_by_keyword(keywords):
+        for i, c in enumerate(cols_lower):
+            if any(k in c for k in keywords): return i
+        return None
+
+    i_data = get_idx_by_keyword(['data', 'dt', 'date', 'movimento'])
+    i_valor = get_idx_by_keyword(['valor', 'value', 'amount', 'débito', 'crédito', 'saldo'])
+    if i_data is None and len(posicoes) > 0: i_data = 0
+    if i_valor is None and len(posicoes) > 1: i_valor = len(posicoes) - 1
+
+    i_desc = get_idx_by_keyword(['descri', 'histórico', 'memo', 'lançamento', 'discriminacao'])
+    if i_desc is None:
+        # Coluna com o texto médio mais longo (fora Data/Valor)
+        max_len = 0
+        for i, pos in enumerate(posicoes):
+            if i in (i_data, i_valor): continue
+            serie = df.iloc[:, pos]
+            mean_len = serie.astype(object).where(serie.notna(), "nan").astype(str).str.len().mean()
+            if mean_len > max_len: max_len, i_desc = mean_len, i
+
+    mapa = {"data": i_data, "valor": i_valor, "desc": i_desc,
+            "ent": get_idx_by_keyword(['entidade', 'cliente', 'nome', 'favorecido']),
+            "cat": get_idx_by_keyword(['categoria', 'classifica']),
+            "conta": get_idx_by_keyword(['conta', 'banco', 'origem'])}
+    return {k: (posicoes[i] if i is not None else None) for k, i in mapa.items()}
+
+def normalizar_extrato(df, mapa):
+    """Converte as linhas brutas no formato da prévia (Conta, Categoria, Entidade, Descrição, Data, Valor)"""
+    def col(k): return df.iloc[:, mapa[k]] if mapa[k] is not None else None
+    s_data, s_valor, s_desc, s_ent, s_cat, s_conta = (col(k) for k in ("data", "valor", "desc", "ent", "cat", "conta"))
+
+    df_final = pd.DataFrame(index=df.index)
+    df_final["Data"] = parse_pdf_data_serie(s_data) if s_data is not None else str(date.today())
+    if s_desc is not None: df_final["Descrição"] = s_desc.astype(str).str.replace("\n", " ").fillna("")
+    else: df_final["Descrição"] = "Sem Descrição"
+    df_final["Valor"] = clean_currency_serie(s_valor) if s_valor is not None else 0.0
+    if s_ent is not None: df_final["Entidade"] = s_ent.astype(str).fillna("")
+    else: df_final["Entidade"] = df_final["Descrição"] 
+    df_final["Conta"] = s_conta.astype(str) if s_conta is not None else "Banco Principal"
+    df_final["Categoria"] = s_cat.astype(str) if s_cat is not None else "Geral"
+    for c in ["Conta", "Categoria", "Entidade", "Descrição"]:
+        df_final[c] = df_final[c].replace({"nan": "", "None": "", "Nb": "", "NaT": ""}).fillna("")
+    df_final = df_final[df_final["Valor"] != 0]
+    return df_final[["Conta", "Categoria", "Entidade", "Descrição", "Data", "Valor"]]
+
+def extrair_paginas_pdf(file):
+    """Gera as linhas de tabela de cada página do PDF, uma página por vez.
+
+    O cabeçalho é o da primeira tabela encontrada; se ele se repete no topo
+    das páginas seguintes, é descartado. O cache de layout de cada página é
+    liberado logo após a extração, então a memória não cresce com o número
+    de páginas. Gera (cabecalho, linhas).
+    """
+    import pdfplumber   # só quando chega um PDF (import pesado)
+    cabecalho = None
+    with pdfplumber.open(file) as pdf:
+        for page in pdf.pages:
+            try:
+                table = page.extract_table()
+                if not table:
+                    table = page.extract_table(table_settings={"vertical_strategy": "text", "horizontal_strategy": "text", "snap_tolerance": 3})
+            finally:
+                page.close()
+            if not table: continue
+            if cabecalho is None or len(table[0]) != len(cabecalho):
+                # Primeira tabela (ou tabela com outro layout): a 1ª linha é o cabeçalho
+                cabecalho, table = table[0], table[1:]
+            elif table[0] == cabecalho:
+                table = table[1:]
+            if table: yield cabecalho, table
+
+def extrair_blocos_pdf(file):
+    """Gera um bloco já normalizado (formato da prévia) por página do PDF"""
+    mapa, cabecalho_mapa = None, None
+    for cabecalho, linhas in extrair_paginas_pdf(file):
+        largura = len(cabecalho)
+        bloco = pd.DataFrame([(list(l) + [None] * largura)[:largura] for l in linhas], columns=range(largura))
+        if mapa is None or cabecalho is not cabecalho_mapa:
+            # Colunas identificadas uma vez por cabeçalho e reaproveitadas nas páginas seguintes
+            mapa = mapear_colunas(bloco.set_axis(cabecalho, axis=1))
+            cabecalho_mapa = cabecalho
+        yield normalizar_extrato(bloco, mapa)
+
+def processar_arquivo_inteligente(file):
+    filename = file.name.lower()
+    if filename.endswith(('.xlsx', '.xls')):
+        try: df = pd.read_excel(file)
+        except: return None, "Erro ao ler Excel."
+        return normalizar_extrato(df, mapear_colunas(df)), "OK"
+    elif filename.endswith('.pdf'):
+        try:
+            blocos = list(extrair_blocos_pdf(file))
+        except Exception as e: return None, f"Erro PDF: {e}"
+        if not blocos: return None, "PDF vazio ou ilegível."
+        return pd.concat(blocos, ignore_index=True), "OK"
+    else:
+        return None, "Formato não suportado."
+
+def processar_arquivo_crm(file):
+    df = pd.DataFrame()
+    try:
+        if file.name.endswith(('.xlsx', '.xls')):
+            df = pd.read_excel(file)
+        elif file.name.endswith('.csv'):
+            df = pd.read_csv(file)
+        else: return None, "Formato inválido (use Excel ou CSV)"
+    except Exception as e: return None, f"Erro ao ler: {e}"
+    
+    # Normalizar nomes das colunas
+    df.columns = [str(c).strip() for c in df.columns]
+    cols_lower = [c.lower() for c in df.columns]
+    
+    # Mapeamento inteligente
+    col_nome, col_cpf, col_email, col_tel, col_obs = None, None, None, None, None
+    
+    for i, col in enumerate(cols_lower):
+        if any(x in col for x in ['nome', 'cliente', 'name']): col_nome = df.columns[i]
+        elif any(x in col for x in ['cpf', 'cnpj', 'doc']): col_cpf = df.columns[i]
+        elif any(x in col for x in ['email', 'mail']): col_email = df.columns[i]
+        elif any(x in col for x in ['tel', 'cel', 'phone', 'whatsapp']): col_tel = df.columns[i]
+        elif any(x in col for x in ['obs', 'info']): col_obs = df.columns[i]
+        
+    if not col_nome: return None, "Coluna 'Nome' não encontrada."
+    
+    df_final = pd.DataFrame()
+    df_final['Nome'] = df[col_nome].astype(str).str.strip()
+    df_final['CPF'] = df[col_cpf].astype(str) if col_cpf else ""
+    df_final['Email'] = df[col_email].astype(str) if col_email else ""
+    df_final['Telefone'] = df[col_tel].astype(str) if col_tel else ""
+    df_final['Obs'] = df[col_obs].astype(str) if col_obs else "Importado"
+    df_final['Data_Cadastro'] = str(date.today())
+    
+    # Remove linhas sem nome
+    df_final = df_final[df_final['Nome'] != "nan"]
+    df_final = df_final[df_final['Nome'] != ""]
+    
+    return df_final, "OK"
+
+# ==========================================
+# CACHE DE ARQUIVOS JÁ LIDOS
+# ==========================================
+# Incrementar sempre que a leitura/normalização mudar: invalida o cache
+VERSAO_PARSER = 1
+DIR_CACHE_IMPORTACAO = os.path.join('.cache', 'importacao')
+
+def sha256_arquivo(dados):
+    return hashlib.sha256(dados).hexdigest()
+
+def chave_arquivo(dados, crm=False, digest=None):
+    """SHA-256 do conteúdo + versão do parser (o nome do arquivo não importa).
+    digest: SHA-256 já calculado dos mesmos dados (evita ler o arquivo de novo)"""
+    return f"{'crm' if crm else 'fin'}-v{VERSAO_PARSER}-{digest or sha256_arquivo(dados)}"
+
+class CacheImportacao:
+    """Resultados normalizados em Parquet no disco, com descarte LRU por tamanho total"""
+    def __init__(self, pasta=DIR_CACHE_IMPORTACAO, limite_bytes=200 * 1024 * 1024):
+        self.pasta = pasta
+        self.limite_bytes = limite_bytes
+        os.makedirs(pasta, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, f"{chave}.parquet")
+
+    def obter(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            df = pd.read_parquet(caminho)
+            os.utime(caminho)  # marca como usado recentemente
+            return df
+        except (OSError, ValueError):
+            return None
+
+    def guardar(self, chave, df):
+        caminho = self._caminho(chave)
+        temp = f"{caminho}.{os.getpid()}.tmp"
+        df.reset_index(drop=True).to_parquet(temp, index=False)
+        os.replace(temp, caminho)
+        self._descartar_antigos()
+
+    def _descartar_antigos(self):
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if not nome.endswith(".parquet"): continue
+            try:
+                st_arq = os.stat(os.path.join(self.pasta, nome))
+                arquivos.append((st_arq.st_mtime, st_arq.st_size, nome))
+            except OSError: pass
+        total = sum(a[1] for a in arquivos)
+        for _, tamanho, nome in sorted(arquivos):
+            if total <= self.limite_bytes: break
+            try: os.remove(os.path.join(self.pasta, nome))
+            except OSError: pass
+            total -= tamanho
+
+# ==========================================
+# IMPORTAÇÃO EM LOTE (PROCESSOS)
+# ==========================================
+class ArquivoEmMemoria(io.BytesIO):
+    """Arquivo enviado (nome + bytes) que pode ser repassado a outro processo"""
+    def __init__(self, nome, dados):
+        super().__init__(dados)
+        self.name = nome
+
+def processar_arquivo(nome, dados, crm=False):
+    """Unidade de trabalho do pool: lê um arquivo e devolve (df, msg)"""
+    arquivo = ArquivoEmMemoria(nome, dados)
+    return processar_arquivo_crm(arquivo) if crm else processar_arquivo_inteligente(arquivo)
+
+def criar_pool_importacao():
+    # "spawn": o servidor do Streamlit tem várias threads, e fork + threads não é seguro
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+def processar_lote(arquivos, crm=False, executor=None, cache=None, digests=None):
+    """Gera (indice, nome, df, msg) à medida que cada arquivo termina.
+
+    arquivos: lista de (nome, bytes); digests: SHA-256 de cada um, se já
+    calculados. Arquivos já lidos antes (mesmo conteúdo) saem do cache na
+    hora. Sem executor (ou com um só arquivo a ler), processa no próprio
+    processo, na ordem.
+    """
+    chaves = [chave_arquivo(dados, crm, digest) for (_, dados), digest in zip(arquivos, digests or [None] * len(arquivos))] if cache else []
+    pendentes = []
+    for i, (nome, dados) in enumerate(arquivos):
+        df = cache.obter(chaves[i]) if cache else None
+        if df is not None: yield i, nome, df, "OK"
+        else: pendentes.append((i, nome, dados))
+
+    def concluir(i, nome, dados, df, msg):
+        if cache and df is not None and not df.empty:
+            try: cache.guardar(chaves[i], df)
+            except Exception: pass  # cache é só otimização
+        return i, nome, df, msg
+
+    if executor is None or len(pendentes) < 2:
+        for i, nome, dados in pendentes:
+            try: df, msg = processar_arquivo(nome, dados, crm)
+            except Exception as e: df, msg = None, f"Erro: {e}"
+            yield concluir(i, nome, dados, df, msg)
+        return
+    futuros = {executor.submit(processar_arquivo, nome, dados, crm): (i, nome, dados) for i, nome, dados in pendentes}
+    for futuro in as_completed(futuros):
+        i, nome, dados = futuros[futuro]
+        try: df, msg = futuro.result()
+        except BrokenProcessPool: raise
+        except Exception as e: df, msg = None, f"Erro: {e}"
+        yield concluir(i, nome, dados, df, msg)
@@ -0,0 +1,93 @@
+import sqlite3
+from contextlib import closing
+from datetime import date
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+import banco
+
+@pytest.fixture
+def conn():
+    with closing(sqlite3.connect(":memory:")) as conn:
+        yield conn
+
+def clientes(conn):
+    return conn.execute("SELECT Nome, CPF, Email, Duplicado_de FROM clientes ORDER BY id").fetchall()
+
+def test_migracao_nao_junta_cpf_placeholder(conn):
+    banco._migracao_001_schema_base(conn.cursor())
+    conn.executemany("INSERT INTO clientes (Nome, CPF, Email) VALUES (?, ?, ?)", [
+        ("Ana", "nan", ""), ("Bia", "nan", ""), ("Caio", "nan", ""),
+        ("Davi", "123.456.789-00", ""), ("Davi S.", "12345678900", "davi@x.com")])
+    conn.commit()
+
+    banco.aplicar_migracoes(conn)
+
+    assert clientes(conn) == [("Ana", "nan", "", None), ("Bia", "nan", "", None), ("Caio", "nan", "", None),
+                              ("Davi", "123.456.789-00", "davi@x.com", None), ("Davi S.", "12345678900", "davi@x.com", 4)]
+
+def test_upsert_sem_documento_usa_o_nome(conn):
+    banco.aplicar_migracoes(conn)
+    for nome, cpf in [("Ana", "nan"), ("Bia", "N/A"), ("Ana", None), ("Caio", "123"), ("Caio", "123.456.789-00"), ("Davi", "98765432100")]:
+        conn.execute(banco.SQL_UPSERT_CLIENTE, banco.params_cliente(nome, cpf, "", "", "2025-01-01", ""))
+
+    assert [r[0] for r in clientes(conn)] == ["Ana", "Bia", "Caio", "Caio", "Davi"]
+    params = banco.params_cliente("Davi Souza", "123.456.789-00", "", "", "2025-01-01", "")
+    assert params[6] == "12345678900"
+    assert banco.id_cliente(conn, params) == conn.execute("SELECT id FROM clientes WHERE CPF = '123.456.789-00'").fetchone()[0]
+    assert banco.digitos_documento("N/A") == banco.digitos_documento(float("nan")) == ""
+
+def test_migracao_refaz_id_sem_chave_primaria(conn):
+    # Tabela como o antigo to_sql(if_exists='replace') gravava: "id" REAL, sem PRIMARY KEY, NULL nas linhas novas
+    pd.DataFrame({"id": [1, 2, None], "Data": ["2025-01-01"] * 3, "Consultor": ["Gu"] * 3, "Cliente": ["Ana", "Bia", "Caio"],
+                  "CPF": [""] * 3, "Servico": ["Score"] * 3, "Valor": [10.0, 20.0, 30.0], "Status_Pagamento": ["Pago Total"] * 3,
+                  "Docs": [""] * 3}).to_sql("vendas", conn, index=False)
+
+    banco.aplicar_migracoes(conn)
+
+    assert conn.execute("SELECT id, Cliente FROM vendas ORDER BY id").fetchall() == [(1, "Ana"), (2, "Bia"), (3, "Caio")]
+    assert conn.execute("SELECT rowid FROM busca_vendas WHERE busca_vendas MATCH 'caio'").fetchall() == [(3,)]
+    cur = conn.execute("INSERT INTO vendas (Data, Cliente, Valor) VALUES ('2025-01-02', 'Davi', 5)")
+    assert conn.execute("SELECT id FROM vendas WHERE Cliente = 'Davi'").fetchone() == (cur.lastrowid,)
+    assert conn.execute("SELECT SUM(Qtd), SUM(Valor) FROM resumo_vendas_diario").fetchone() == (4, 65.0)
+
+def test_migracao_refaz_id_not_null_e_so_junta_conta_igual(conn):
+    conn.execute('CREATE TABLE bancos ("id" INTEGER NOT NULL, Banco TEXT, Agencia TEXT, Conta TEXT)')
+    conn.executemany("INSERT INTO bancos VALUES (?, ?, ?, ?)", [(1, "Itaú", "1", "10"), (2, "Itaú", "1", "20"), (3, "Itaú", "1", "10")])
+    conn.commit()
+
+    banco.aplicar_migracoes(conn)
+
+    assert conn.execute("SELECT id, Banco, Agencia, Conta FROM bancos ORDER BY id").fetchall() == [(1, "Itaú", "1", "10"), (2, "Itaú", "1", "20")]
+    assert banco._id_canonico(conn, "bancos")
+
+def test_filtro_de_periodo_inclui_o_ultimo_dia_com_hora(conn):
+    banco.aplicar_migracoes(conn)
+    conn.executemany("INSERT INTO vendas (Data, Cliente, Valor) VALUES (?, ?, 1)", [
+        ("2024-12-31 23:59:59", "antes"), ("2025-01-01", "inicio"), ("2025-01-31 18:30:00", "fim"), ("2025-02-01", "depois")])
+
+    where, params = banco.filtro_sql("vendas", (date(2025, 1, 1), date(2025, 1, 31)))
+
+    assert [r[0] for r in conn.execute(f"SELECT Cliente FROM vendas WHERE {where} ORDER BY Data", params)] == ["inicio", "fim"]
+
+def test_tabelas_da_query_so_no_comeco_do_comando():
+    assert banco.tabelas_da_query(banco.SQL_UPSERT_CLIENTE) == ["clientes"]
+    assert banco.tabelas_da_query("INSERT OR IGNORE INTO servicos (Nome) VALUES (?)") == ["servicos"]
+    assert banco.tabelas_da_query("  update vendas SET Valor = 1; DELETE FROM despesas WHERE id = 2") == ["despesas", "vendas"]
+
+def test_snapshot_dentro_de_uma_transacao_de_leitura(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear()
+    try:
+        with banco.transacao() as conn:
+            conn.execute("INSERT INTO mural (Titulo) VALUES ('aviso')")
+        with banco.conexao() as conn:
+            conn.execute("BEGIN")
+            destino = banco.criar_snapshot()
+            assert conn.in_transaction
+        with closing(sqlite3.connect(destino)) as copia:
+            assert copia.execute("SELECT COUNT(*) FROM mural").fetchone() == (1,)
+    finally:
+        st.cache_resource.clear()
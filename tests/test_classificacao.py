@@ -0,0 +1,70 @@
+import http.server
+import json
+import re
+import threading
+
+import pytest
+import streamlit as st
+
+from classificacao import ModeloLocal, classificar_descricoes, normalizar_texto
+
+class ServidorOpenAI(http.server.BaseHTTPRequestHandler):
+    """Stub de POST /v1/chat/completions: responde "N -> Cat | Ent" para cada item do prompt"""
+    lotes = []
+
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        itens = re.findall(r"^\s*(\d+)\. (.*)$", corpo["messages"][0]["content"].split("Itens:", 1)[1], re.MULTILINE)
+        self.lotes.append([d for _, d in itens])
+        conteudo = "\n".join(f"{n} -> Categoria {d.split()[-1]} | Loja" for n, d in itens)
+        dados = json.dumps({"id": "x", "object": "chat.completion", "created": 0, "model": corpo["model"],
+                            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": conteudo}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def base_url():
+    ServidorOpenAI.lotes = []
+    servidor = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ServidorOpenAI)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+    servidor.shutdown()
+    servidor.server_close()
+
+@pytest.fixture
+def banco_temporario(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear()
+    yield
+    st.cache_resource.clear()
+
+def test_modelo_local_ignora_rotulos_marcadores(monkeypatch):
+    modelo = ModeloLocal("despesas")
+    monkeypatch.setattr(modelo, "sincronizar", lambda: None)
+    modelo._acrescentar([(1, "PIX ENVIADO POSTO SHELL", "Geral", ""), (2, "TARIFA PACOTE", "  ", "Banco"),
+                         (3, "PAGTO BOLETO LUZ", "nan", "nan"), (4, "COMPRA CARTAO MERCADO", "Alimentação", "  ")])
+
+    assert list(modelo.docs) == [normalizar_texto("COMPRA CARTAO MERCADO")]
+    assert modelo.prever(["COMPRA CARTAO MERCADO"]) == {"COMPRA CARTAO MERCADO": ("Alimentação", "", 1.0)}
+    assert modelo.ultimo_id == 4
+
+def test_ia_em_lotes_e_memo_sem_diferenca_de_caixa(base_url, banco_temporario):
+    descricoes = [f"PIX LOJA {i}" for i in range(95)]
+
+    res, erros = classificar_descricoes(descricoes, "chave-teste", base_url)
+
+    assert erros == []
+    assert sorted(len(lote) for lote in ServidorOpenAI.lotes) == [15, 40, 40]
+    assert res["PIX LOJA 7"] == ("Categoria 7", "Loja")
+
+    ServidorOpenAI.lotes.clear()
+    res, erros = classificar_descricoes([f"  pix  loja {i} " for i in range(95)], "chave-teste", base_url)
+
+    assert ServidorOpenAI.lotes == []
+    assert len(res) == 95 and res["  pix  loja 7 "] == ("Categoria 7", "Loja")
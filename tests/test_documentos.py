@@ -0,0 +1,46 @@
+import io
+import os
+import sqlite3
+import zipfile
+
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+import banco
+from documentos import caminho_blob, gravar_uploads, salvar_documentos, zip_arquivos
+
+def baixar(callable_dados):
+    """Executa o callable como o download_button faz no clique (arquivo "deferred")"""
+    gerenciador = MediaFileManager(MemoryMediaFileStorage("/media"))
+    file_id = gerenciador.add_deferred(callable_dados, "application/zip", "coordenada", "tudo.zip")
+    url = gerenciador.execute_deferred(file_id)
+    arquivo_id = url.rsplit("/", 1)[-1].split(".")[0]
+    return gerenciador._storage.get_file(arquivo_id).content
+
+def test_zip_arquivos_pelo_download_button(tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"primeiro")
+    (tmp_path / "b.pdf").write_bytes(b"segundo")
+    itens = [("doc.pdf", tmp_path / "a.pdf"), ("doc.pdf", tmp_path / "b.pdf")]
+
+    dados = baixar(lambda: zip_arquivos(itens))
+
+    with zipfile.ZipFile(io.BytesIO(dados)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["doc.pdf", "doc (2).pdf"]
+        assert zf.read("doc (2).pdf") == b"segundo"
+
+def test_blobs_gravados_antes_da_transacao(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    arquivos = [io.BytesIO(b"pdf"), io.BytesIO(b"pdf")]
+    arquivos[0].name, arquivos[1].name = "a.pdf", "copia.pdf"
+
+    blobs = gravar_uploads(arquivos)
+
+    assert [b[1:] for b in blobs] == [(3, "a.pdf", "application/pdf"), (3, "copia.pdf", "application/pdf")]
+    assert os.listdir(os.path.dirname(caminho_blob(blobs[0][0]))) == [blobs[0][0]]
+    conn = sqlite3.connect(":memory:")
+    banco.aplicar_migracoes(conn)
+    with conn:
+        assert salvar_documentos(conn, blobs, venda_id=7) == 2
+    assert conn.execute("SELECT Hash, Nome, Tamanho, Venda_id FROM documentos ORDER BY id").fetchall() == [
+        (blobs[0][0], "a.pdf", 3, 7), (blobs[0][0], "copia.pdf", 3, 7)]
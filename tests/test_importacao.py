@@ -0,0 +1,60 @@
+import re
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import importacao
+
+# Versões linha a linha (as originais): referência das versões vetorizadas
+def clean_currency(val_str):
+    if pd.isna(val_str): return 0.0
+    if isinstance(val_str, (int, float)): return float(val_str)
+    clean = str(val_str).strip()
+    is_negative = "-" in clean or "D" in clean.upper() or "(" in clean
+    clean = re.sub(r'[^\d.,]', '', clean)
+    if not clean: return 0.0
+    if "," in clean and "." in clean:
+        clean = clean.replace(".", "").replace(",", ".")
+    elif "," in clean:
+        clean = clean.replace(",", ".")
+    try:
+        val = float(clean)
+        return -val if is_negative else val
+    except ValueError:
+        return 0.0
+
+def parse_pdf_data(date_str):
+    if not date_str: return str(date.today())
+    match = re.search(r'\d{2}/\d{2}/\d{2,4}', str(date_str))
+    if match:
+        d = match.group(0)
+        try: return str(datetime.strptime(d, "%d/%m/%Y").date())
+        except ValueError:
+            try: return str(datetime.strptime(d, "%d/%m/%y").date())
+            except ValueError: pass
+    return str(date.today())
+
+VALORES = ["1.234,56", "-1.234,56", "R$ 99,90", "(50,00)", "120,00 D", "12.50", "1,5", "", "abc", None, np.nan, 7, 3.25, "1.234.567,89"]
+DATAS = ["31/12/2025", "01/02/24 PIX", "Data: 05/06/2023", "99/99/2025", "sem data", "", None, "2025-01-01"]
+
+def test_versoes_vetorizadas_iguais_as_escalares():
+    assert importacao.clean_currency_serie(pd.Series(VALORES, dtype=object)).tolist() == [clean_currency(v) for v in VALORES]
+    assert importacao.parse_pdf_data_serie(pd.Series(DATAS, dtype=object)).tolist() == [parse_pdf_data(d) for d in DATAS]
+
+class CacheMemoria:
+    def __init__(self, df):
+        self.df, self.chaves = df, []
+    def obter(self, chave):
+        self.chaves.append(chave)
+        return self.df
+
+def test_processar_lote_usa_o_digest_recebido(monkeypatch):
+    def nao_calcular(dados): raise AssertionError("SHA-256 calculado de novo")
+    monkeypatch.setattr(importacao, "sha256_arquivo", nao_calcular)
+    cache = CacheMemoria(pd.DataFrame({"Valor": [1.0]}))
+
+    lote = list(importacao.processar_lote([("a.xlsx", b"a"), ("b.xlsx", b"b")], cache=cache, digests=["d1", "d2"]))
+
+    assert [(i, nome, msg) for i, nome, _, msg in lote] == [(0, "a.xlsx", "OK"), (1, "b.xlsx", "OK")]
+    assert cache.chaves == [importacao.chave_arquivo(b"", digest="d1"), importacao.chave_arquivo(b"", digest="d2")]